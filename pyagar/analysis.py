@@ -0,0 +1,200 @@
+"""
+``pyagar.analysis``
+===================
+
+Metrics of recorded gameplays, computed in parallel with NumPy.
+
+For each recording a ``.npz`` file is written with the arrays:
+
+  * ``time``, ``mass``, ``x``, ``y``: seconds since the start, mass and
+    center of the player at every ``Status``. ``alive`` tells whether
+    the player had any cell.
+  * ``kills``, ``deaths``: when the player ate a named cell and when its
+    last cell was eaten.
+  * ``leaderboard_time``, ``leaderboard_rank``: the position of the
+    player in every leaderboard (0 if not in it).
+  * ``heatmap``: seconds spent alive in each square of the board.
+
+"""
+# pylint: disable=I0011,C0103
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+from pyagar.messages import MSG, Decoders
+from pyagar.messages import Status, PlayerCell, Leaderboard, ScreenAndCamera
+from pyagar.recording import Recording
+from pyagar.world import World
+
+#: Squares of the side of the heatmap.
+HEATMAP_BINS = 64
+
+
+def mass(size):
+    """The mass of a cell of ``size``."""
+    return size * size / 100
+
+
+def duration(times):
+    """How long each sample lasts: until the next one."""
+    return np.append(np.diff(times), 0)[:len(times)]
+
+
+def metrics(frames):
+    """Returns the arrays of the metrics of some (timestamp, frame)."""
+    decoders = Decoders()
+    decoders.want((Status, PlayerCell, Leaderboard, ScreenAndCamera))
+    world = World()
+
+    start = None
+    times, alive = [], []
+    # One entry per visible cell of the player at each ``Status``.
+    ticks, sizes, xs, ys = [], [], [], []
+    kills, deaths = [], []
+    ranks = []
+    for timestamp, frame in frames:
+        data = MSG(frame, decoders=decoders).data
+        if data is None:
+            continue
+        if start is None:
+            start = timestamp
+        now = timestamp - start
+
+        if isinstance(data, Status):
+            owned = set(world.owned)
+            eaten = [e.eatee for e in data.eat]
+            kills.extend(now for e in data.eat
+                         if e.eater in owned and e.eatee not in owned and
+                         world.names.get(e.eatee))
+            world.apply(data)
+            if owned.intersection(eaten) and not world.owned:
+                deaths.append(now)
+
+            tick = len(times)
+            for cell in world.player_cells:
+                ticks.append(tick)
+                sizes.append(cell.size)
+                xs.append(cell.x)
+                ys.append(cell.y)
+            times.append(now)
+            alive.append(world.alive)
+        elif isinstance(data, Leaderboard):
+            rank = next((i for i, p in enumerate(data.players, 1)
+                         if p.id in world.owned), 0)
+            ranks.append((now, rank))
+        else:
+            world.apply(data)
+
+    # Aggregate the cells of each tick at once.
+    ticks = np.array(ticks, dtype=np.intp)
+    masses = mass(np.array(sizes, dtype=np.float64))
+
+    def per_tick(weights):
+        """The sum of ``weights`` for each tick."""
+        return np.bincount(ticks, weights=weights,
+                           minlength=max(len(times), 1))[:len(times)]
+
+    total = per_tick(masses)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = per_tick(masses * xs) / total
+        y = per_tick(masses * ys) / total
+    x[total == 0] = y[total == 0] = np.nan
+
+    table = np.empty(len(times), dtype=[('time', 'f8'), ('mass', 'f4'),
+                                        ('x', 'f4'), ('y', 'f4'),
+                                        ('alive', '?')])
+    table['time'] = times
+    table['mass'] = total
+    table['x'] = x
+    table['y'] = y
+    table['alive'] = alive
+    board = np.array(ranks, dtype=[('time', 'f8'), ('rank', 'u1')])
+
+    durations = duration(table['time'])
+    alive = table['alive'] & ~np.isnan(table['x'])
+    if world.screen is not None:
+        extent = [[world.screen.x1, world.screen.x2],
+                  [world.screen.y1, world.screen.y2]]
+    else:
+        extent = None
+    heatmap, _, _ = np.histogram2d(table['x'][alive], table['y'][alive],
+                                   bins=HEATMAP_BINS, range=extent,
+                                   weights=durations[alive])
+
+    return {'time': table['time'],
+            'mass': table['mass'],
+            'x': table['x'],
+            'y': table['y'],
+            'alive': table['alive'],
+            'kills': np.array(kills, dtype='f8'),
+            'deaths': np.array(deaths, dtype='f8'),
+            'leaderboard_time': board['time'],
+            'leaderboard_rank': board['rank'],
+            'heatmap': heatmap.astype('f4')}
+
+
+def summary(arrays):
+    """The figures of a game out of its ``metrics``."""
+    durations = duration(arrays['time'])
+    ranks = arrays['leaderboard_rank']
+    ranks = ranks[ranks > 0]
+    return {'duration': float(durations.sum()),
+            'alive': float(durations[arrays['alive']].sum()),
+            'max_mass': float(arrays['mass'].max() if len(durations)
+                              else 0),
+            'kills': len(arrays['kills']),
+            'deaths': len(arrays['deaths']),
+            'best_rank': int(ranks.min() if len(ranks) else 0)}
+
+
+def analyze(filename, output):
+    """
+    Computes the metrics of the recording ``filename`` and saves them in
+    the directory ``output``. Returns its ``summary``.
+
+    """
+    with Recording(filename) as recording:
+        arrays = metrics(recording)
+    np.savez_compressed(output_filename(filename, output), **arrays)
+    return dict(summary(arrays), file=filename)
+
+
+def output_filename(filename, output):
+    """Where the metrics of the recording ``filename`` are saved."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(output, name + ".npz")
+
+
+def analyze_all(filenames, output, workers=None):
+    """
+    Analyzes the recordings ``filenames`` with a pool of ``workers``
+    processes, one per core by default. Yields the summaries in order.
+
+    Raises ``ValueError`` if a recording is given twice or the metrics
+    of several recordings would be saved in the same file.
+
+    """
+    seen = {}
+    for filename in filenames:
+        target = output_filename(filename, output)
+        if target in seen:
+            if seen[target] == filename:
+                raise ValueError("%s is given twice." % filename)
+            raise ValueError("%s and %s would be saved in the same file, "
+                             "rename one of them." % (seen[target], filename))
+        seen[target] = filename
+    os.makedirs(output, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(analyze, filenames, [output] * len(filenames))
+
+
+def print_summaries(summaries):
+    """Prints a pretty table with the summaries of the games."""
+    from tabulate import tabulate
+    headers = ["File", "Duration", "Alive", "Max mass", "Kills", "Deaths",
+               "Best rank"]
+    table = [[s['file'], s['duration'], s['alive'], s['max_mass'],
+              s['kills'], s['deaths'], s['best_rank'] or '-']
+             for s in summaries]
+    print(tabulate(table, headers, tablefmt="rst", floatfmt=".1f"))
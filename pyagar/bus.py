@@ -0,0 +1,131 @@
+"""
+``pyagar.bus``
+==============
+
+Typed publish/subscribe of the messages.
+
+"""
+# pylint: disable=I0011,R0903
+from itertools import chain
+import asyncio
+
+from pyagar.messages import MSG
+from pyagar.queues import MessageQueue
+
+
+class Raw:
+    """
+    Subscribe to this type to receive the raw frames of the source as
+    ``memoryview``, undecoded and including the unknown ones.
+
+    """
+
+
+class Sent(bytes):
+    """
+    A command sent by the source. Subscribe to this type to receive
+    them.
+
+    """
+
+
+class Bus:
+    """
+    Delivers the messages of ``src.messages`` only to the consumers
+    subscribed to their type.
+
+    The source may queue ``MSG`` (the frame and the decoded message)
+    or just decoded messages, and ``Sent`` commands. If it has
+    ``decoders``, they are told to skip the types without subscribers,
+    and its ``raw`` and ``outgoing`` attributes tell whether the
+    undecoded frames and the commands are wanted too.
+
+    Every message is applied once to each distinct ``world`` of the
+    subscribers before it is delivered, even as a raw frame.
+
+    """
+    def __init__(self, src):
+        self.src = src
+        self.subscribers = []
+        self.raw = []
+        self.worlds = []
+        self.routes = {}
+
+    def subscribe(self, consumer, types=None):
+        """
+        Deliver to ``consumer.messages`` the messages of ``types``, by
+        default ``consumer.wants``. ``None`` means all the decoded
+        messages.
+
+        """
+        if types is None:
+            types = getattr(consumer, 'wants', None)
+        queue = consumer.messages
+
+        if types is not None and Raw in types:
+            self.raw.append(queue)
+            types = tuple(t for t in types if t is not Raw)
+        if types is None or types:
+            self.subscribers.append((queue, types))
+
+        world = getattr(consumer, 'world', None)
+        if world is not None and world not in self.worlds:
+            self.worlds.append(world)
+
+        self.routes.clear()
+        self.configure()
+
+    def configure(self):
+        """Tells the source which messages have subscribers."""
+        decoders = getattr(self.src, 'decoders', None)
+        if decoders is not None:
+            wanted = ([types for _, types in self.subscribers] +
+                      [world.wants for world in self.worlds])
+            if any(types is None for types in wanted):
+                decoders.want(None)
+            else:
+                decoders.want(tuple(set(chain.from_iterable(wanted))))
+        if hasattr(self.src, 'raw'):
+            self.src.raw = bool(self.raw)
+        if hasattr(self.src, 'outgoing'):
+            self.src.outgoing = any(types is not None and Sent in types
+                                    for _, types in self.subscribers)
+
+    def route(self, kind):
+        """The queues subscribed to the messages of class ``kind``."""
+        try:
+            return self.routes[kind]
+        except KeyError:
+            queues = self.routes[kind] = [
+                queue for queue, types in self.subscribers
+                if types is None or issubclass(kind, types)]
+            return queues
+
+    @asyncio.coroutine
+    def publish(self, queues, item):
+        """Puts ``item`` in all the ``queues``."""
+        for queue in queues:
+            if isinstance(queue, MessageQueue):
+                yield from queue.push(item)
+            else:
+                queue.put_nowait(item)
+
+    @asyncio.coroutine
+    def run(self):
+        """Delivers the messages forever."""
+        src_q = self.src.messages
+        while True:
+            item = yield from src_q.get()
+            if isinstance(item, MSG):
+                frame, data = item.buf, item.data
+            else:
+                frame, data = None, item
+
+            if data is not None:
+                for world in self.worlds:
+                    world.apply(data)
+            if frame is not None:
+                yield from self.publish(self.raw, frame)
+            if data is not None:
+                yield from self.publish(self.route(type(data)), data)
+            src_q.task_done()
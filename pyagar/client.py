@@ -6,9 +6,9 @@ This module contains the Client class.
 
 """
 # pylint: disable=I0011,C0103
+from collections import deque
 import base64
 import random
-import struct
 import asyncio
 import requests
 
@@ -22,6 +22,9 @@ USER_AGENT = (
     'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
     'Chrome/43.0.2357.125 Safari/537.36')
 
+#: Maximum number of commands waiting to be sent.
+MAX_COMMANDS = 64
+
 #
 # <monkeypatch>
 # Monkeypatch the websockets library to bypass agar.io "limitations".
@@ -48,7 +51,8 @@ client.build_request = build_request
 #
 # </monkeypatch>
 #
-from pyagar import messages
+from pyagar import commands, messages
+from pyagar.bus import Sent
 import websockets
 
 
@@ -59,8 +63,24 @@ class Client:
     Manages the connection, receives the data from the server and sends
     back any command requested by the player.
 
+    With ``columnar`` the cells of the ``Status`` messages are decoded
+    into NumPy arrays (see :mod:`pyagar.columnar`). With ``lazy`` they
+    are decoded only when some consumer looks at them. Custom parsers
+    can be registered in ``decoders``.
+
+    ``messages`` receives the decoded frames as ``MSG``, to be
+    delivered by a :class:`pyagar.bus.Bus`. The frames nobody decodes
+    are only queued if ``raw`` is set, and the commands sent, as
+    ``Sent``, if ``outgoing`` is set.
+
+    All the commands are sent by ``write``, in the order they were
+    requested. A movement requested right after another one not sent
+    yet overwrites it instead of being queued. ``sent``, ``coalesced``
+    (overwritten movements) and ``dropped`` count what happened to them.
+
     """
-    def __init__(self, nick, region='EU-London', party=False):
+    def __init__(self, nick, region='EU-London', party=False,
+                 columnar=False, lazy=True):
         self.nick = nick
         self.region = region
         self.server = None
@@ -71,6 +91,15 @@ class Client:
         self.ws = None
         self.connected = asyncio.Event()
         self.messages = asyncio.Queue()
+        self.raw = False
+        self.outgoing = False
+        self.commands = deque()
+        #: Whether the last command queued is a movement.
+        self.move_queued = False
+        self.pending = asyncio.Event()
+        self.sent = self.coalesced = self.dropped = 0
+        self.columnar = columnar
+        self.decoders = messages.Decoders(columnar=columnar, lazy=lazy)
 
     def create_party(self):
         """Create a new party."""
@@ -126,42 +155,92 @@ class Client:
         logger.info("Connecting to server %s", self.server)
         self.ws = yield from websockets.connect("ws://" + self.server,
                                                 origin='http://agar.io')
-        yield from self.ws.send(struct.pack("<BI", 254, PROTO_VERSION))
-        yield from self.ws.send(struct.pack("<BI", 255, int(INIT_TOKEN)))
+        yield from self.ws.send(commands.protocol(PROTO_VERSION))
+        yield from self.ws.send(commands.init(INIT_TOKEN))
 
         # Send token
-        msg = struct.pack("B" + ("B" * len(self.token)),
-                          80, *[ord(c) for c in self.token])
-
-        yield from self.ws.send(msg)
+        yield from self.ws.send(commands.token(self.token))
         logger.debug("Connected!")
         self.connected.set()
 
+    def push(self, payload):
+        """Queues ``payload``, dropping the oldest command if full."""
+        if len(self.commands) >= MAX_COMMANDS:
+            self.commands.popleft()
+            self.dropped += 1
+        self.commands.append(payload)
+        self.pending.set()
+
+    def enqueue(self, payload):
+        """Queue an encoded command (see :mod:`pyagar.commands`)."""
+        self.push(payload)
+        self.move_queued = False
+
+    def set_move(self, x, y):
+        """
+        Queue the movement, replacing the last command if it is a
+        movement not sent yet.
+
+        """
+        if self.move_queued and self.commands:
+            self.commands[-1] = commands.move(x, y)
+            self.coalesced += 1
+        else:
+            self.push(commands.move(x, y))
+            self.move_queued = True
+
+    @asyncio.coroutine
+    def write(self):
+        """Send the queued commands to the server."""
+        while True:
+            yield from self.pending.wait()
+            self.pending.clear()
+            yield from self.connected.wait()
+            while self.commands:
+                payload = self.commands.popleft()
+                if not self.commands:
+                    self.move_queued = False
+                yield from self.send(payload)
+
+    @asyncio.coroutine
+    def send(self, payload):
+        """Sends ``payload``, dropping it if it can not be sent."""
+        try:
+            yield from self.ws.send(payload)
+        except asyncio.CancelledError:
+            raise
+        except websockets.exceptions.InvalidState:
+            self.dropped += 1
+        except Exception:  # pylint: disable=W0703
+            # The writer must survive to send through the next
+            # connection.
+            logger.warning("Command %r not sent.", payload, exc_info=True)
+            self.dropped += 1
+        else:
+            self.sent += 1
+            if self.outgoing:
+                self.messages.put_nowait(Sent(payload))
+
     @asyncio.coroutine
     def spawn(self):
         """Sends the ``spawn`` command."""
         yield from self.connected.wait()
-        rawnick = self.nick.encode('utf-8')
-        msg = struct.pack("<B" + ("H" * len(rawnick)),
-                          0, *rawnick)
-        yield from self.ws.send(msg)
-        logger.debug("Spawn sent.")
+        self.enqueue(commands.spawn(self.nick))
+        logger.debug("Spawn queued.")
 
     @asyncio.coroutine
     def split(self):
         """Sends the ``split cell`` command."""
         yield from self.connected.wait()
-        msg = struct.pack("<B", 17)
-        yield from self.ws.send(msg)
-        logger.debug("Split sent.")
+        self.enqueue(commands.SPLIT)
+        logger.debug("Split queued.")
 
     @asyncio.coroutine
     def eject(self):
         """Sends the ``mass eject`` command."""
         yield from self.connected.wait()
-        msg = struct.pack("<B", 21)
-        yield from self.ws.send(msg)
-        logger.debug("Eject sent.")
+        self.enqueue(commands.EJECT)
+        logger.debug("Eject queued.")
 
     @asyncio.coroutine
     def read(self):
@@ -172,25 +251,29 @@ class Client:
             if data is None:
                 self.connected.clear()
                 self.server = self.token = None
+                # Nothing queued makes sense for the next server.
+                self.dropped += len(self.commands)
+                self.commands.clear()
+                self.move_queued = False
                 yield from self.connect()
                 continue
-            msg = messages.MSG(data)
-            if msg.data is None:
+            msg = messages.MSG(data, decoders=self.decoders)
+            if msg.data is None and not msg.skipped:
                 logger.warning("Unknown message %r", msg)
-            else:
-                yield from self.messages.put(msg.data)
+            if msg.data is not None or self.raw:
+                yield from self.messages.put(msg)
 
     @asyncio.coroutine
     def move(self, x, y):
         """Sends the ``movement`` command."""
         yield from self.connected.wait()
-        yield from self.ws.send(struct.pack("<BddI", 16, x, y, 0))
-        logger.debug("Move sent (x=%s, y=%s)", x, y)
+        self.set_move(x, y)
+        logger.debug("Move queued (x=%s, y=%s)", x, y)
 
     @asyncio.coroutine
     def spectate(self):
         """Initiates the spectator mode."""
         yield from self.connected.wait()
         yield from asyncio.sleep(2)
-        yield from self.ws.send(struct.pack("B", 1))
-        logger.debug("Spectate sent.")
+        self.enqueue(commands.SPECTATE)
+        logger.debug("Spectate queued.")
@@ -15,6 +15,58 @@ import textwrap
 from pyagar import LOOP, NICK, VERSION
 
 
+def speed(value):
+    """Parses the replay speed; ``max`` means no waits at all."""
+    if value == "max":
+        return float('inf')
+    value = float(value)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("the speed must be positive")
+    return value
+
+
+def bot_class(args):
+    """
+    The ``Controller`` selected with ``--type`` or ``--from-file``, if
+    any.
+
+    """
+    from pyagar.control import Controller
+    if args.type:
+        from pyagar import control
+        if not hasattr(control, args.type):
+            print("Unknown bot type")
+            sys.exit(1)
+        bot = getattr(control, args.type)
+        if (not isinstance(bot, type) or
+                not issubclass(bot, Controller) or bot is Controller):
+            print("Invalid bot type.")
+            sys.exit(1)
+        return bot
+    elif args.from_file:
+        module = imp.load_source('botmodule', args.from_file)
+        if (not hasattr(module, 'UserBot') or
+                not issubclass(module.UserBot, Controller)):
+            print("Invalid bot.")
+        else:
+            return module.UserBot
+    return None
+
+
+def build_bot(bot, client, world, rate=None):
+    """
+    Builds the controller ``bot`` for ``client`` reading ``world``.
+
+    ``world`` and ``rate`` are set after building it, so the bots
+    whose ``__init__`` only takes the client keep working.
+
+    """
+    controller = bot(client)
+    controller.world = world
+    controller.rate = rate
+    return controller
+
+
 def pyagar_parser():
     """Generates the argument parser."""
     parser = argparse.ArgumentParser()
@@ -48,6 +100,38 @@ def pyagar_parser():
         help=("save the gameplay in a file; "
               "you can replay it later using the ``replay`` command"))
 
+    parser.add_argument(
+        "--flight-recorder",
+        metavar="DIRECTORY",
+        help=("keep the last seconds of the gameplay in memory and save "
+              "them in this directory when the player dies or on SIGUSR1"))
+
+    parser.add_argument(
+        "--flight-seconds",
+        type=float,
+        default=30,
+        metavar="SECONDS",
+        help="seconds kept in memory by ``--flight-recorder``")
+
+    parser.add_argument(
+        "--fsync-interval",
+        type=float,
+        default=5,
+        metavar="SECONDS",
+        help="sync the gameplay saved with ``--save`` to disk this often")
+
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help=("decode the cells into NumPy arrays; "
+              "faster with lots of visible cells, requires numpy"))
+
+    parser.add_argument(
+        "--stale-after",
+        type=float,
+        metavar="SECONDS",
+        help="forget the cells not updated for this number of seconds")
+
     parser.add_argument('--version', action='version',
                         version='%(prog)s ' + VERSION)
 
@@ -98,6 +182,11 @@ def pyagar_parser():
         '--from-file',
         action='store',
         help="use a controller from a python file")
+    bot.add_argument(
+        '--rate',
+        type=float,
+        help=("maximum number of decisions per second; "
+              "by default one per batch of received messages"))
 
     # Replay subcommand
     replay = subparsers.add_parser(
@@ -107,16 +196,85 @@ def pyagar_parser():
         'gameplay_file',
         nargs=1,
         help="full path to the record file")
+    replay.add_argument(
+        '--speed',
+        type=speed,
+        default=1,
+        help=("playback speed, ``2`` is twice as fast; "
+              "``max`` plays as fast as the consumers can go"))
+    replay.add_argument(
+        '--headless',
+        action='store_true',
+        help="replay without the visualizer")
+    group = replay.add_mutually_exclusive_group()
+    group.add_argument(
+        '--type',
+        action='store',
+        help="type of controller fed with the replay")
+    group.add_argument(
+        '--from-file',
+        action='store',
+        help="feed with the replay a controller from a python file")
+    replay.add_argument(
+        '--rate',
+        type=float,
+        help="maximum number of decisions per second of the controller")
+
+    # Convert subcommand
+    convert = subparsers.add_parser(
+        "convert",
+        help="convert a gameplay saved by older versions to the new format")
+    convert.add_argument(
+        'old_file',
+        help="full path to the old record file")
+    convert.add_argument(
+        'new_file',
+        help="full path to the new record file")
+
+    # Analyze subcommand
+    analyze = subparsers.add_parser(
+        "analyze",
+        help="compute the metrics of many recorded gameplays in parallel")
+    analyze.add_argument(
+        'gameplay_files',
+        nargs='+',
+        help="full path to the record files")
+    analyze.add_argument(
+        '-o',
+        '--output',
+        default='.',
+        help="directory where the metrics of each gameplay are saved")
+    analyze.add_argument(
+        '--workers',
+        type=int,
+        help="number of processes; by default one per core")
+
+    # Export subcommand
+    export = subparsers.add_parser(
+        "export",
+        help=("export recorded gameplays as a state/action dataset of "
+              "memory-mappable NumPy arrays"))
+    export.add_argument(
+        'gameplay_files',
+        nargs='+',
+        help="full path to the record files")
+    export.add_argument(
+        '-o',
+        '--output',
+        required=True,
+        help="directory of the dataset; new games are added after the rest")
+    export.add_argument(
+        '--chunk-rows',
+        type=int,
+        default=1 << 16,
+        help="rows of each file of the dataset")
 
     return parser
 
 
 def pyagar(argv=None):
     """pyagar cli interface."""
-    from pyagar.client import Client
     from pyagar.log import logger
-    from pyagar.utils import hub, GameplaySaver, GameReplay
-    from pyagar.visual import Visualizer
 
     args = pyagar_parser().parse_args(argv)
     if args.command is None:
@@ -125,6 +283,7 @@ def pyagar(argv=None):
 
     coros = []
     dsts = []
+    saver = None
 
     if args.debug is not None:
         logger.setLevel(logging.DEBUG)
@@ -141,28 +300,85 @@ def pyagar(argv=None):
     if VERSION:
         logger.info("Version %s", VERSION)
 
-    if args.command == "replay":
-        visualizer = Visualizer(
-            None,
-            view_only=True,
-            hardware=not args.disable_hw)
-        dsts.append(visualizer)
-        
-        replayer = GameReplay(args.gameplay_file[0])
+    if args.command == "convert":
+        from pyagar.recording import convert
+        count = convert(args.old_file, args.new_file)
+        logger.info("%d frames converted.", count)
+        sys.exit(0)
+
+    if args.command == "analyze":
+        from pyagar.analysis import analyze_all, print_summaries
+        try:
+            print_summaries(analyze_all(args.gameplay_files, args.output,
+                                        workers=args.workers))
+        except ValueError as exc:
+            logger.error("%s", exc)
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.command == "export":
+        from pyagar.dataset import export_all
+        for filename, rows in export_all(args.gameplay_files, args.output,
+                                         chunk_rows=args.chunk_rows):
+            logger.info("%s: %d rows exported.", filename, rows)
+        sys.exit(0)
+
+    # The subcommands above do not need the client nor the SDL.
+    from pyagar.client import Client
+    from pyagar.bus import Bus
+    from pyagar.recording import GameplaySaver, GameReplay
+    from pyagar.utils import monitor, BLOCK
+    from pyagar.visual import Visualizer
+    from pyagar.world import World
+
+    world = World(columnar=args.columnar, ttl=args.stale_after)
 
+    if args.command == "replay":
+        replayer = GameReplay(args.gameplay_file[0],
+                              columnar=args.columnar,
+                              world=world,
+                              speed=args.speed)
         coros.append(replayer.run())
-        coros.append(visualizer.run())
-        coros.append(hub(replayer, *dsts))
+
+        if not args.headless:
+            visualizer = Visualizer(
+                None,
+                view_only=True,
+                hardware=not args.disable_hw,
+                world=world,
+                replay=replayer)
+            coros.append(visualizer.run())
+            dsts.append(visualizer)
+
+        bot = bot_class(args)
+        if bot is not None:
+            from pyagar.recording import OfflineClient
+            controller = build_bot(bot,
+                                   OfflineClient(args.nick, args.columnar),
+                                   world, rate=args.rate)
+            coros.append(controller.run())
+            dsts.append(controller)
+
+        bus = Bus(replayer)
+        for dst in dsts:
+            if args.speed == float('inf'):
+                # Nothing is dropped, the replay waits for the consumers.
+                dst.messages.overflow = BLOCK
+            bus.subscribe(dst)
+        coros.append(bus.run())
 
     else:
         party = args.create_party or args.join_party or False
-        client = Client(args.nick, region=args.region, party=party)
+        client = Client(args.nick, region=args.region, party=party,
+                        columnar=args.columnar)
         coros.append(client.read())
+        coros.append(client.write())
 
         visualizer = Visualizer(
             client,
             view_only=args.command != "play",
-            hardware=not args.disable_hw)
+            hardware=not args.disable_hw,
+            world=world)
         coros.append(visualizer.run())
         dsts.append(visualizer)
 
@@ -184,46 +400,48 @@ def pyagar(argv=None):
                         subsequent_indent='    ')
                     print(msg)
                 sys.exit(0)
-            elif args.type:
-                from pyagar import control
-                if not hasattr(control, args.type):
-                    print("Unknown bot type")
-                    sys.exit(1)
-                else:
-                    bot = getattr(control, args.type)
-                    if (not issubclass(bot, control.Controller) or
-                            bot is control.Controller):
-                        print("Invalid bot type.")
-                        sys.exit(1)
-                    else:
-                        controller = bot(client)
-                        coros.append(controller.run())
-                        dsts.append(controller)
-            elif args.from_file:
-                from pyagar.control import Controller
-                module = imp.load_source('botmodule', args.from_file)
-                if (not hasattr(module, 'UserBot') or
-                        not issubclass(module.UserBot, Controller)):
-                    print("Invalid bot.")
-                else:
-                    controller = module.UserBot(client)
+            else:
+                bot = bot_class(args)
+                if bot is not None:
+                    controller = build_bot(bot, client, world,
+                                           rate=args.rate)
                     coros.append(controller.run())
                     dsts.append(controller)
 
         if args.save is not None:
-            saver = GameplaySaver(args.save)
+            saver = GameplaySaver(args.save, world=world,
+                                  fsync_interval=args.fsync_interval)
             coros.append(saver.run())
             dsts.append(saver)
 
-        coros.append(hub(client, *dsts))
+        if args.flight_recorder is not None:
+            from pyagar.recording import FlightRecorder
+            recorder = FlightRecorder(args.flight_recorder,
+                                      seconds=args.flight_seconds,
+                                      world=world)
+            coros.append(recorder.run())
+            dsts.append(recorder)
+
+        bus = Bus(client)
+        for dst in dsts:
+            bus.subscribe(dst)
+        coros.append(bus.run())
 
         LOOP.run_until_complete(client.connect())
 
         if args.command == "spectate":
             LOOP.run_until_complete(client.spectate())
 
+    if args.debug is not None:
+        coros.append(monitor(*dsts))
+
     game = asyncio.wait(coros, return_when=asyncio.FIRST_COMPLETED)
-    done, _ = LOOP.run_until_complete(game)
+    try:
+        done, _ = LOOP.run_until_complete(game)
+    finally:
+        if saver is not None:
+            # Its coroutine is never resumed, write what it left pending.
+            saver.close()
     for coro in done:
         try:
             coro.result()
@@ -0,0 +1,300 @@
+"""
+``pyagar.columnar``
+===================
+
+Columnar representation of the cells backed by NumPy.
+
+The cells of a ``Status`` frame are decoded into a structured array
+(one row per cell) instead of a list of ``Cell``, and the state built
+from them can be queried with vectorized operations.
+
+"""
+# pylint: disable=I0011,C0103
+import numpy as np
+
+from pyagar.messages import Cell, Status, LazyStatus, CELL_RECORD, compiled
+
+#: Layout of a cell record inside the frame.
+RECORD_DTYPE = np.dtype([('id', '<u4'), ('x', '<i4'), ('y', '<i4'),
+                         ('size', '<i2'), ('r', 'u1'), ('g', 'u1'),
+                         ('b', 'u1'), ('flags', 'u1')])
+
+#: Columns of a decoded cell.
+CELL_DTYPE = np.dtype([('id', '<u4'), ('x', '<i4'), ('y', '<i4'),
+                       ('size', '<i2'), ('rgb', '<u4'), ('flags', 'u1')])
+
+#: Just the id and the flags of a cell record.
+CELL_PEEK = compiled("I13xB")
+
+_SPAN = np.arange(CELL_RECORD.size)
+
+
+def border_colors(rgb):
+    """Vectorized :func:`pyagar.messages.border_color`."""
+    channels = np.stack((rgb >> 16, rgb >> 8 & 0xff, rgb & 0xff))
+    r, g, b = np.maximum(channels.astype(np.int64) - 0x10, 0)
+    return r << 16 | g << 8 | b
+
+
+def to_cells(array, names):
+    """Materializes the rows of ``array`` as a list of ``Cell``."""
+    borders = border_colors(array['rgb']).tolist()
+    return [Cell(_id, x, y, size, rgb, bool(flags & 1), names.get(_id),
+                 border)
+            for (_id, x, y, size, rgb, flags), border
+            in zip(array.tolist(), borders)]
+
+
+def from_cells(cells):
+    """Returns the rows and the names side table of some ``Cell``."""
+    cells = list(cells)
+    array = np.array([(c.id, c.x, c.y, c.size, c.color, int(c.is_virus))
+                      for c in cells], dtype=CELL_DTYPE)
+    names = {c.id: c.name for c in cells if c.name}
+    return array, names
+
+
+class ColumnarStatus(Status):
+    """
+    A ``Status`` whose cells are decoded into a structured array.
+
+    The rows are in ``table`` and the names of the cells in the side
+    table ``names``. ``cells`` is still available, built on first
+    access.
+
+    """
+    def parse_cells(self):
+        """Unpacks the visible cells into ``table`` and ``names``."""
+        offsets = []
+        self.names = {}
+        record = self.cell_record(CELL_PEEK)
+        while record is not None:
+            _id, k = record
+            offsets.append(self.offset - CELL_PEEK.size)
+            self.skip_cell_extra(k)
+            name = self.name()
+            if name:
+                self.names[_id] = name
+            record = self.cell_record(CELL_PEEK)
+
+        # Gather all the records at once.
+        raw = np.frombuffer(self.buf, dtype=np.uint8)
+        index = np.add.outer(np.array(offsets, dtype=np.intp), _SPAN)
+        records = raw[index].view(RECORD_DTYPE).ravel()
+
+        self.table = np.empty(len(records), dtype=CELL_DTYPE)
+        for column in ('id', 'x', 'y', 'size', 'flags'):
+            self.table[column] = records[column]
+        self.table['rgb'] = (records['r'].astype('<u4') << 16 |
+                             records['g'].astype('<u4') << 8 |
+                             records['b'])
+
+    @property
+    def cells(self):
+        """The cells as a list of ``Cell``."""
+        try:
+            return self._cells
+        except AttributeError:
+            self._cells = to_cells(self.table, self.names)
+            return self._cells
+
+
+class LazyColumnarStatus(LazyStatus, ColumnarStatus):
+    """A ``ColumnarStatus`` decoding its cells on first access."""
+    lazy = LazyStatus.lazy + ('table', 'names')
+
+
+class CellSelection:
+    """
+    A sequence of cells selected from a ``CellTable``.
+
+    Iterating it yields ``Cell``, while ``array`` keeps the rows for
+    vectorized operations.
+
+    """
+    def __init__(self, array, names):
+        self.array = array
+        self.names = names
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, idx):
+        return to_cells(self.array[[idx]], self.names)[0]
+
+    def __iter__(self):
+        return iter(to_cells(self.array, self.names))
+
+    def distances(self, x, y):
+        """Manhattan distance from each cell to (``x``, ``y``)."""
+        return (np.abs(self.array['x'].astype(np.int64) - x) +
+                np.abs(self.array['y'].astype(np.int64) - y))
+
+    def nearest(self, x, y):
+        """The closest cell to (``x``, ``y``). None if there are no cells."""
+        if not len(self.array):
+            return None
+        else:
+            return self[int(np.argmin(self.distances(x, y)))]
+
+    def drawing_order(self):
+        """Returns the cells sorted by size, viruses last."""
+        order = np.lexsort((self.array['size'], self.array['flags'] & 1))
+        return CellSelection(self.array[order], self.names)
+
+    def stage_coords(self, screen, stage_w, stage_h):
+        """
+        Translate the position and the size of every cell from game to
+        stage coordinates.
+
+        """
+        xs = ((self.array['x'] - screen.x1) * stage_w /
+              (screen.x2 - screen.x1))
+        ys = ((self.array['y'] - screen.y1) * stage_h /
+              (screen.y2 - screen.y1))
+        gs_area = (screen.x2 - screen.x1) * (screen.y2 - screen.y1)
+        sizes = np.sqrt(stage_w * stage_h *
+                        self.array['size'].astype(np.float64) ** 2 /
+                        gs_area)
+        return xs.astype(int), ys.astype(int), sizes.astype(int)
+
+
+class CellTable:
+    """
+    The visible cells, keyed by cell id, stored in columns.
+
+    Behaves like the ``dict`` of ``Cell`` the consumers keep, but
+    ``Status`` deltas are applied and queried with vectorized
+    operations. It also implements the queries of
+    :class:`pyagar.spatial.Grid`.
+
+    The rows are kept sorted by id, so a single cell is found with a
+    binary search.
+
+    """
+    def __init__(self):
+        self.array = np.empty(0, dtype=CELL_DTYPE)
+        self.names = {}
+        #: When was each row last updated.
+        self.seen = np.empty(0)
+
+    def apply(self, status, now=0):
+        """Apply the changes of a ``Status`` message received at ``now``."""
+        if isinstance(status, ColumnarStatus):
+            new, names = status.table, status.names
+        else:
+            new, names = from_cells(status.cells)
+
+        gone = ([d.id for d in status.dissapears] +
+                [e.eatee for e in status.eat])
+        self.names.update(names)
+        for _id in gone:
+            self.names.pop(_id, None)
+
+        gone = np.array(gone, dtype='<u4')
+        new = new[~np.isin(new['id'], gone)]
+        keep = ~np.isin(self.array['id'], np.concatenate((gone, new['id'])))
+        array = np.concatenate((self.array[keep], new))
+        seen = np.concatenate((self.seen[keep], np.full(len(new), now)))
+        order = np.argsort(array['id'], kind='mergesort')
+        self.array = array[order]
+        self.seen = seen[order]
+
+    def evict(self, before):
+        """Removes the cells not updated since ``before``, returns the ids."""
+        stale = self.seen < before
+        ids = self.array['id'][stale].tolist()
+        for _id in ids:
+            self.names.pop(_id, None)
+        self.array = self.array[~stale]
+        self.seen = self.seen[~stale]
+        return ids
+
+    def select(self, exclude=None, virus=None, bigger_than=None,
+               smaller_than=None):
+        """
+        Returns the ``CellSelection`` of the cells matching all the
+        given filters. All the cells without filters.
+
+        ``exclude`` is a collection of ids.
+
+        """
+        mask = np.ones(len(self.array), dtype=bool)
+        if exclude:
+            mask &= ~np.isin(self.array['id'], list(exclude))
+        if virus is not None:
+            mask &= (self.array['flags'] & 1).astype(bool) == virus
+        if bigger_than is not None:
+            mask &= self.array['size'] > bigger_than
+        if smaller_than is not None:
+            mask &= self.array['size'] < smaller_than
+        return CellSelection(self.array[mask], self.names)
+
+    filter = select
+
+    def knearest(self, x, y, k=1, **filters):
+        """
+        The ``k`` cells closest (manhattan) to (``x``, ``y``) passing
+        ``filters`` (see :mod:`pyagar.spatial`), nearest first.
+
+        """
+        cells = self.select(**filters)
+        order = np.argsort(cells.distances(x, y), kind='mergesort')[:k]
+        return to_cells(cells.array[order], self.names)
+
+    def within_rect(self, x1, y1, x2, y2, **filters):
+        """The cells inside the rectangle (``x1``, ``y1``, ``x2``, ``y2``)."""
+        cells = self.select(**filters).array
+        inside = ((cells['x'] >= x1) & (cells['x'] <= x2) &
+                  (cells['y'] >= y1) & (cells['y'] <= y2))
+        return CellSelection(cells[inside], self.names)
+
+    def within_radius(self, x, y, radius, **filters):
+        """The cells at less than ``radius`` of (``x``, ``y``)."""
+        cells = self.select(**filters).array
+        inside = np.hypot(cells['x'] - x, cells['y'] - y) < radius
+        return CellSelection(cells[inside], self.names)
+
+    def position(self, _id):
+        """The row of the cell ``_id``. None if it is not in the table."""
+        ids = self.array['id']
+        pos = int(np.searchsorted(ids, _id))
+        if pos < len(ids) and ids[pos] == _id:
+            return pos
+        else:
+            return None
+
+    def get(self, _id, default=None):
+        """The ``Cell`` with id ``_id`` or ``default``."""
+        pos = self.position(_id)
+        if pos is None:
+            return default
+        else:
+            return to_cells(self.array[pos:pos + 1], self.names)[0]
+
+    def __getitem__(self, _id):
+        cell = self.get(_id)
+        if cell is None:
+            raise KeyError(_id)
+        else:
+            return cell
+
+    def __contains__(self, _id):
+        return self.position(_id) is not None
+
+    def __delitem__(self, _id):
+        pos = self.position(_id)
+        if pos is None:
+            raise KeyError(_id)
+        self.array = np.delete(self.array, pos)
+        self.seen = np.delete(self.seen, pos)
+
+    def __iter__(self):
+        return iter(self.array['id'].tolist())
+
+    def __len__(self):
+        return len(self.array)
+
+    def values(self):
+        """All the cells as a list of ``Cell``."""
+        return to_cells(self.array, self.names)
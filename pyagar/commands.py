@@ -0,0 +1,89 @@
+"""
+``pyagar.commands``
+===================
+
+Protocol implementation, the commands sent to the server.
+
+The counterpart of :mod:`pyagar.messages`. The payloads which never
+change are encoded once, and the rest use precompiled records.
+
+"""
+# pylint: disable=I0011,C0103
+from enum import Enum
+from functools import lru_cache
+
+from pyagar.messages import compiled
+
+
+class CommandType(Enum):
+    """
+    This enum contains the identifier of each command.
+
+    """
+    Spawn = 0
+    Spectate = 1
+    Move = 16
+    Split = 17
+    Eject = 21
+    Token = 80
+    Protocol = 254
+    Init = 255
+
+
+OPCODE = compiled("B")
+HANDSHAKE = compiled("BI")
+MOVE = compiled("BddI")
+
+SPECTATE = OPCODE.pack(CommandType.Spectate.value)
+SPLIT = OPCODE.pack(CommandType.Split.value)
+EJECT = OPCODE.pack(CommandType.Eject.value)
+
+
+def protocol(version):
+    """Encodes the protocol version announcement."""
+    return HANDSHAKE.pack(CommandType.Protocol.value, version)
+
+
+def init(token):
+    """Encodes the initialization token."""
+    return HANDSHAKE.pack(CommandType.Init.value, int(token))
+
+
+def token(value):
+    """Encodes the server token."""
+    return OPCODE.pack(CommandType.Token.value) + value.encode('ascii')
+
+
+@lru_cache(maxsize=32)
+def spawn(nick):
+    """
+    Encodes the ``spawn`` command.
+
+    Each byte of the UTF-8 encoded nick is sent as an ``UINT16``.
+
+    """
+    rawnick = nick.encode('utf-8')
+    return (OPCODE.pack(CommandType.Spawn.value) +
+            compiled("%dH" % len(rawnick)).pack(*rawnick))
+
+
+def move(x, y):
+    """Encodes the ``movement`` command."""
+    return MOVE.pack(CommandType.Move.value, x, y, 0)
+
+
+def decode(payload):
+    """
+    Returns the ``CommandType`` of ``payload`` and, for the movements,
+    the (x, y) target. ``(None, None)`` for unknown commands.
+
+    """
+    try:
+        command = CommandType(payload[0])
+    except ValueError:
+        return None, None
+    if command is CommandType.Move:
+        _, x, y, _ = MOVE.unpack_from(payload)
+        return command, (x, y)
+    else:
+        return command, None
@@ -7,26 +7,131 @@ Some very simple bots.
 """
 # pylint: disable=I0011,C0103
 from collections import namedtuple
+from functools import wraps
 import asyncio
 
 from pyagar.log import logger
 from pyagar.messages import Status, PlayerCell, ScreenAndCamera
+from pyagar.utils import MessageQueue, COALESCE
+from pyagar.world import World
 
 Movement = namedtuple('Movement', ['x', 'y'])
 
 
+def view(method):
+    """
+    A property derived from the world state.
+
+    It is computed at most once per state update and cached until the
+    world changes again, so the returned value must not be modified.
+
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def cached(self):
+        """Returns the cached value if the world has not changed."""
+        views = self.__dict__.setdefault('_views', {})
+        version = self.world.version
+        try:
+            seen, value = views[name]
+        except KeyError:
+            pass
+        else:
+            if seen == version:
+                return value
+        value = method(self)
+        views[name] = (version, value)
+        return value
+
+    return property(cached)
+
+
+def world_attribute(name, doc):
+    """
+    An attribute read from the world, which a bot may still assign to
+    keep its own value as the bots written before the ``World`` did.
+
+    """
+    def get(self):
+        """Returns the value of the bot, if any, or the world's one."""
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            return getattr(self.world, name)
+
+    def set(self, value):
+        """Overrides the value of the world."""
+        self.__dict__[name] = value
+
+    def delete(self):
+        """Goes back to the value of the world."""
+        self.__dict__.pop(name, None)
+
+    return property(get, set, delete, doc)
+
+
+WORLD_ATTRIBUTES = ('columnar', 'cells', 'player_id', 'alive', 'screen')
+
+
 class Controller:
     """
     All bots should inherit from this class.
 
+    The state of the game is read from ``world``, a
+    :class:`pyagar.world.World` which may be shared with other
+    consumers. The cell selections and the nearest cell searches are
+    answered by its spatial index.
+
+    Only the message types in ``wants`` are received; bots needing
+    other messages must extend it.
+
+    ``player``, ``opponents``, ``predators``, ``edible`` and
+    ``viruses`` are computed once per world update. ``cells``,
+    ``player_id``, ``alive``, ``screen`` and ``columnar`` are read from
+    the world unless the bot assigns them.
+
+    All the messages pending when the bot wakes up are coalesced into a
+    single decision, and with ``rate`` at most ``rate`` decisions per
+    second are made. ``ticks`` counts the decisions and ``coalesced``
+    the messages that did not get a decision of their own.
+
     """
-    def __init__(self, client):
+    wants = (Status, PlayerCell, ScreenAndCamera)
+
+    def __init__(self, client, world=None, rate=None):
         self.client = client
-        self.messages = asyncio.Queue()
-        self.cells = {}
-        self.player_id = None
-        self.alive = False
-        self.screen = None
+        self.messages = MessageQueue(overflow=COALESCE)
+        if world is None:
+            world = World(columnar=client.columnar)
+        self.world = world
+        self.rate = rate
+        self.ticks = 0
+        self.coalesced = 0
+
+    @property
+    def world(self):
+        """The state of the game."""
+        return self._world
+
+    @world.setter
+    def world(self, world):
+        """
+        Reads another world, forgetting the views of the old one and
+        the values assigned in its place.
+
+        """
+        self._world = world
+        for name in ('_views',) + WORLD_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+
+    columnar = world_attribute('columnar',
+                               "Whether the cells are stored in columns.")
+    cells = world_attribute('cells', "The visible cells.")
+    player_id = world_attribute(
+        'player_id', "The id of the player main cell. None if not exists.")
+    alive = world_attribute('alive', "Whether the player has any cell.")
+    screen = world_attribute('screen', "The game board.")
 
     def get_name(self):
         """Returns the name of this bot."""
@@ -39,39 +144,76 @@ class Controller:
         """The method that subclasses must implement."""
         raise NotImplementedError()
 
-    @property
+    @view
     def predators(self):
         """Cells that can eat me."""
         p = self.player
         if p:
-            return [c for c in self.opponents if c.size > p.size * 1.1]
+            return self.world.index.filter(exclude=self.world.owned,
+                                           virus=False,
+                                           bigger_than=p.size * 1.1)
         else:
             return []
 
-    @property
+    @view
     def edible(self):
         """You can eat cells 10% smaller than you."""
         p = self.player
         if p:
-            return [c for c in self.opponents if c.size * 1.1 < p.size]
+            return self.world.index.filter(exclude=self.world.owned,
+                                           virus=False,
+                                           smaller_than=p.size / 1.1)
         else:
             return []
 
-    @property
+    @view
     def player(self):
         """Returns the player main cell. None if not exists."""
-        return self.cells.get(self.player_id)
+        return self.world.player
 
-    @property
+    @view
     def viruses(self):
         """Returns a list of visible viruses."""
-        return [c for c in self.cells.values() if c.is_virus]
+        return self.world.index.filter(virus=True)
 
-    @property
+    @view
     def opponents(self):
         """Return list of other cells."""
-        return [c for c in self.cells.values()
-                if c.id != self.player_id and not c.is_virus]
+        return self.world.index.filter(exclude=self.world.owned,
+                                       virus=False)
+
+    def closest(self, cells):
+        """Returns the closest of ``cells`` to the player."""
+        p = self.player
+        if hasattr(cells, 'nearest'):
+            return cells.nearest(p.x, p.y)
+        else:
+            return min(cells, key=lambda c: abs(c.x-p.x)+abs(c.y-p.y))
+
+    def nearest(self, k=1, **filters):
+        """
+        The ``k`` non-virus opponents closest to the player which pass
+        ``filters`` (see :mod:`pyagar.spatial`), nearest first.
+
+        """
+        p = self.player
+        if p:
+            return self.world.index.knearest(p.x, p.y, k,
+                                             exclude=self.world.owned,
+                                             virus=False, **filters)
+        else:
+            return []
+
+    def nearest_opponent(self):
+        """The closest opponent. None if there is none."""
+        cells = self.nearest()
+        return cells[0] if cells else None
+
+    def nearest_edible(self):
+        """The closest edible cell. None if there is none."""
+        p = self.player
+        cells = self.nearest(smaller_than=p.size / 1.1) if p else []
+        return cells[0] if cells else None
 
     @asyncio.coroutine
     def do_move(self):
@@ -80,44 +222,46 @@ class Controller:
         if m is not None:
             yield from self.client.move(m.x, m.y)
 
+    def drain(self):
+        """Discards the pending messages, returns how many were there."""
+        pending = 0
+        while not self.messages.empty():
+            self.messages.get_nowait()
+            pending += 1
+        return pending
+
     @asyncio.coroutine
     def run(self):
         """The main loop of the bot."""
         logger.info("Running bot '%s'", self.get_name())
 
+        loop = asyncio.get_event_loop()
         while True:
-            data = yield from self.messages.get()
-            if isinstance(data, Status):
-                for cell in data.cells:
-                    self.cells[cell.id] = cell
-                for cell in data.dissapears:
-                    if cell.id in self.cells:
-                        del self.cells[cell.id]
-                for eats in data.eat:
-                    if eats.eatee == self.player_id:
-                        self.alive = False
-                    if eats.eatee in self.cells:
-                        del self.cells[eats.eatee]
-            elif isinstance(data, PlayerCell):
-                self.player_id = data.cell.id
-                self.alive = True
-            elif isinstance(data, ScreenAndCamera):
-                self.screen = data.screen
-            else:
-                pass
+            yield from self.messages.get()
+            tick = loop.time()
+
+            # The world is already up to date, the messages in the queue
+            # are just stale notifications.
+            pending = self.drain()
+            self.ticks += 1
+            self.coalesced += pending
+            if pending:
+                logger.debug("Coalesced %d messages (%d in %d ticks).",
+                             pending, self.coalesced, self.ticks)
 
             if not self.alive:
                 yield from self.client.spawn()
             yield from self.do_move()
 
+            if self.rate:
+                yield from asyncio.sleep(tick + 1 / self.rate - loop.time())
+
 
 class Closer(Controller):
     """Go to the closer "non-virus" cell, no matter the type."""
     def get_movement(self):
-        p = self.player
-        o = self.opponents
-        if p and o:
-            closer = min(o, key=lambda c: abs(c.x-p.x)+abs(c.y-p.y))
+        closer = self.nearest_opponent()
+        if closer is not None:
             return Movement(closer.x, closer.y)
         else:
             return None
@@ -126,10 +270,8 @@ class Closer(Controller):
 class Greedy(Controller):
     """Only wants to eat."""
     def get_movement(self):
-        o = self.edible
-        p = self.player
-        if o and p:
-            closer = min(o, key=lambda c: abs(c.x-p.x)+abs(c.y-p.y))
+        closer = self.nearest_edible()
+        if closer is not None:
             return Movement(closer.x, closer.y)
         else:
             return None
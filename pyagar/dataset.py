@@ -0,0 +1,163 @@
+"""
+``pyagar.dataset``
+==================
+
+State/action datasets built from recorded gameplays.
+
+Every ``Status`` received is a tick and becomes one row of ``DTYPE``:
+the state of the world after it and the commands sent until the next
+one. The rows are written in chunks of ``CHUNK_ROWS`` as ``.npy`` files
+which can be memory-mapped with :func:`load`.
+
+"""
+# pylint: disable=I0011,C0103
+import glob
+import os
+
+import numpy as np
+
+from pyagar import commands
+from pyagar.commands import CommandType
+from pyagar.messages import MSG, Decoders
+from pyagar.messages import Status, PlayerCell, ScreenAndCamera
+from pyagar.recording import Recording, KEYFRAME, OUTGOING
+from pyagar.recording import split_keyframe
+from pyagar.world import World
+
+#: Rows of each chunk.
+CHUNK_ROWS = 1 << 16
+
+#: Nearest cells described in each row.
+NEIGHBORS = 16
+
+#: The columns of a row.
+DTYPE = np.dtype([
+    ('game', '<u4'), ('time', '<f8'),
+    # State
+    ('alive', '?'), ('x', '<f4'), ('y', '<f4'), ('mass', '<f4'),
+    ('cells', '<u2'),
+    # (dx, dy, size, is_virus) of the nearest cells, zero padded.
+    ('neighbors', '<f4', (NEIGHBORS, 4)),
+    # Action
+    ('move', '?'), ('move_x', '<f4'), ('move_y', '<f4'),
+    ('split', '?'), ('eject', '?'), ('spawn', '?')])
+
+_ACTIONS = {CommandType.Split: 'split',
+            CommandType.Eject: 'eject',
+            CommandType.Spawn: 'spawn'}
+
+
+class DatasetWriter:
+    """Writes rows in chunks to the directory ``output``."""
+    def __init__(self, output, chunk_rows=CHUNK_ROWS):
+        os.makedirs(output, exist_ok=True)
+        self.output = output
+        self.chunk = np.zeros(chunk_rows, dtype=DTYPE)
+        self.rows = 0
+        self.chunks = len(glob.glob(os.path.join(output, "chunk-*.npy")))
+
+    def row(self):
+        """The next row to fill."""
+        if self.rows == len(self.chunk):
+            self.flush()
+        row = self.chunk[self.rows]
+        self.rows += 1
+        return row
+
+    def flush(self):
+        """Writes the rows filled as a new chunk."""
+        if self.rows:
+            filename = os.path.join(self.output,
+                                    "chunk-%05d.npy" % self.chunks)
+            np.save(filename, self.chunk[:self.rows])
+            self.chunks += 1
+            self.chunk[:] = 0
+            self.rows = 0
+
+
+def state(row, world):
+    """Fills the state columns of ``row`` with ``world``."""
+    cells = world.player_cells
+    row['alive'] = world.alive
+    row['cells'] = len(cells)
+    if not cells:
+        return
+    sizes = np.array([c.size for c in cells], dtype=np.float64)
+    masses = sizes * sizes / 100
+    row['mass'] = masses.sum()
+    row['x'] = x = np.dot(masses, [c.x for c in cells]) / masses.sum()
+    row['y'] = y = np.dot(masses, [c.y for c in cells]) / masses.sum()
+
+    near = world.index.knearest(x, y, k=NEIGHBORS, exclude=world.owned)
+    if near:
+        row['neighbors'][:len(near)] = [(c.x - x, c.y - y, c.size,
+                                         c.is_virus) for c in near]
+
+
+def export(filename, writer, game=0):
+    """
+    Streams the recording ``filename`` into ``writer``, its rows tagged
+    with ``game``. Returns the number of rows.
+
+    """
+    decoders = Decoders()
+    decoders.want((Status, PlayerCell, ScreenAndCamera))
+    world = World()
+    row = None
+    count = 0
+    with Recording(filename) as recording:
+        for _, timestamp, kind, payload in recording.records():
+            if kind == OUTGOING:
+                if row is None:
+                    continue
+                command, target = commands.decode(payload)
+                if command is CommandType.Move:
+                    row['move'] = True
+                    row['move_x'], row['move_y'] = target
+                elif command in _ACTIONS:
+                    row[_ACTIONS[command]] = True
+            elif kind == KEYFRAME:
+                # Only the state before the first tick is missing, the
+                # later keyframes restate what the world already has.
+                if row is None:
+                    for frame in split_keyframe(payload):
+                        data = MSG(frame, decoders=decoders).data
+                        if data is not None:
+                            world.apply(data)
+            else:
+                data = MSG(payload, decoders=decoders).data
+                if data is None:
+                    continue
+                world.apply(data)
+                if isinstance(data, Status):
+                    row = writer.row()
+                    row['game'] = game
+                    row['time'] = timestamp
+                    state(row, world)
+                    count += 1
+    return count
+
+
+def export_all(filenames, output, chunk_rows=CHUNK_ROWS):
+    """
+    Exports the recordings ``filenames`` to ``output``, after the games
+    already there, numbering the games in order. Yields the (filename,
+    rows) of each one.
+
+    The last rows are written when it is exhausted or closed.
+
+    """
+    first = max((int(chunk['game'].max()) + 1
+                 for chunk in load(output) if len(chunk)), default=0)
+    writer = DatasetWriter(output, chunk_rows)
+    try:
+        for game, filename in enumerate(filenames, first):
+            yield filename, export(filename, writer, game)
+    finally:
+        writer.flush()
+
+
+def load(output):
+    """The chunks of the dataset in ``output``, memory-mapped."""
+    return [np.load(filename, mmap_mode='r') for filename
+            in sorted(glob.glob(os.path.join(output, "chunk-*.npy")))]
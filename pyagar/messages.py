@@ -7,9 +7,11 @@ Protocol implementation.
 """
 # pylint: disable=I0011,C0103
 from abc import ABCMeta, abstractmethod
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from enum import Enum
+import re
 import struct
+import threading
 
 INT8 = "b"
 INT16 = "h"
@@ -22,8 +24,112 @@ UINT64 = "Q"
 FLOAT32 = "f"
 FLOAT64 = "d"
 
-Cell = namedtuple("Cell", ['id', 'x', 'y', 'size', 'color', 'is_virus',
-                           'name'])
+_STRUCTS = {}
+
+
+def compiled(ctype):
+    """
+    Returns the precompiled ``struct.Struct`` for ``ctype``.
+
+    The protocol is little endian and unaligned, so ``ctype`` is
+    prefixed with ``<`` unless it already carries a byte order.
+
+    """
+    try:
+        return _STRUCTS[ctype]
+    except KeyError:
+        fmt = ctype if ctype[:1] in "@=<>!" else "<" + ctype
+        record = _STRUCTS[ctype] = struct.Struct(fmt)
+        return record
+
+
+_INT8 = compiled(INT8)
+_INT16 = compiled(INT16)
+_INT32 = compiled(INT32)
+_INT64 = compiled(INT64)
+_UINT8 = compiled(UINT8)
+_UINT16 = compiled(UINT16)
+_UINT32 = compiled(UINT32)
+_UINT64 = compiled(UINT64)
+_FLOAT32 = compiled(FLOAT32)
+_FLOAT64 = compiled(FLOAT64)
+
+#: Fixed size records of the protocol, decoded in a single call.
+EAT_RECORD = compiled("II")
+CELL_RECORD = compiled("IiihBBBB")
+SCREEN_RECORD = compiled("dddd")
+CAMERA_RECORD = compiled("fff")
+QARA_RECORD = compiled("hh")
+
+#: NUL terminated strings, by character width: the pattern matching the
+#: characters before the terminator and the codec decoding them.
+STRINGS = {
+    UINT8: (re.compile(b"[^\\x00]*"), "latin-1"),
+    UINT16: (re.compile(b"(?:(?!\\x00\\x00)..)*", re.DOTALL), "utf-16-le"),
+}
+
+
+def border_color(color):
+    """Returns the border color of a cell: a bit darker than ``color``."""
+    r = (color >> 16) - 0x10
+    g = (color >> 8 & 0xff) - 0x10
+    b = (color & 0xff) - 0x10
+    return ((r if r > 0 else 0) << 16 |
+            (g if g > 0 else 0) << 8 |
+            (b if b > 0 else 0))
+
+
+class Cell:
+    """
+    A visible cell.
+
+    ``color`` and ``border`` are packed ``0xRRGGBB`` integers, the
+    border is computed once when the cell is created.
+
+    """
+    __slots__ = ('id', 'x', 'y', 'size', 'color', 'border', 'is_virus',
+                 'name')
+
+    def __new__(cls, id, x, y, size, color, is_virus, name, border=None):
+        # pylint: disable=W0622
+        self = object.__new__(cls)
+        if isinstance(color, str):
+            # Recordings of older versions store the color in hex.
+            color = int(color, base=16)
+        self.id = id
+        self.x = x
+        self.y = y
+        self.size = size
+        self.color = color
+        self.border = border_color(color) if border is None else border
+        self.is_virus = is_virus
+        self.name = name
+        return self
+
+    def astuple(self):
+        """Returns the fields in the order accepted by ``Cell``."""
+        return (self.id, self.x, self.y, self.size, self.color,
+                self.is_virus, self.name, self.border)
+
+    def __reduce__(self):
+        return (Cell, self.astuple())
+
+    def __eq__(self, other):
+        if isinstance(other, Cell):
+            return self.astuple() == other.astuple()
+        else:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash(self.astuple())
+
+    def __repr__(self):
+        return ("Cell(id=%r, x=%r, y=%r, size=%r, color=0x%06x, "
+                "is_virus=%r, name=%r)" % (self.id, self.x, self.y,
+                                           self.size, self.color,
+                                           self.is_virus, self.name))
+
+
 Screen = namedtuple("Screen", ["x1", "y1", "x2", "y2"])
 Camera = namedtuple("Camera", ["x", "y", "zoom"])
 Player = namedtuple("Player", ["id", "name"])
@@ -32,22 +138,92 @@ Dissapear = namedtuple("Dissapear", ["id"])
 PlayerID = namedtuple("PlayerID", ["id"])
 
 
+class NameTable:
+    """
+    Interned names of the cells.
+
+    Each distinct name is decoded once and the same ``str`` is handed
+    out every time it is seen again. At most ``size`` names are kept,
+    the least recently seen are evicted.
+
+    It can be shared by decoders running in several threads.
+
+    """
+    def __init__(self, size=1024):
+        self.size = size
+        self.names = OrderedDict()
+        self.lock = threading.Lock()
+
+    def intern(self, raw):
+        """Returns the name encoded (UTF-16) in the buffer ``raw``."""
+        key = raw
+        try:
+            hash(key)
+        except (TypeError, ValueError):
+            # Views of writable buffers are not hashable.
+            key = bytes(raw)
+        with self.lock:
+            try:
+                name = self.names[key]
+            except KeyError:
+                name = str(raw, 'utf-16-le', 'surrogatepass')
+                self.names[bytes(raw)] = name
+                if len(self.names) > self.size:
+                    self.names.popitem(last=False)
+            else:
+                self.names.move_to_end(key)
+        return name
+
+    def __len__(self):
+        return len(self.names)
+
+
+#: The name table shared by all the decoders.
+NAMES = NameTable()
+
+
 class BaseMSG(metaclass=ABCMeta):
     """
     All messages inherits from this class.
 
     Contains utility methods for unpack the data.
 
+    The data is read through a ``memoryview`` of the frame, so nothing
+    is copied until a field is materialized.
+
     """
     def __init__(self, buf, offset=0):
+        if not isinstance(buf, memoryview):
+            buf = memoryview(buf)
         self.buf = buf
         self.offset = offset
         self.parse()
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['buf'] = self.buf.tobytes()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.buf = memoryview(self.buf)
+
+    def unpack(self, record):
+        """Unpack the precompiled ``record`` and update the offset."""
+        values = record.unpack_from(self.buf, self.offset)
+        self.offset += record.size
+        return values
+
+    def unpack_many(self, record, count):
+        """Unpack ``count`` consecutive ``record`` and update the offset."""
+        end = self.offset + record.size * count
+        values = record.iter_unpack(self.buf[self.offset:end])
+        self.offset = end
+        return values
+
     def get(self, ctype):
         """Unpack the given ``ctype`` and update the offset."""
-        s = struct.unpack_from(ctype, self.buf, offset=self.offset)
-        self.offset += struct.calcsize(ctype)
+        s = self.unpack(compiled(ctype))
         if len(s) == 1:
             return s[0]
         else:
@@ -55,58 +231,79 @@ class BaseMSG(metaclass=ABCMeta):
 
     def getUint8(self):
         """Unpack an ``UINT8``."""
-        return self.get(UINT8)
+        return self.unpack(_UINT8)[0]
 
     def getInt8(self):
         """Unpack an ``INT8``."""
-        return self.get(INT8)
+        return self.unpack(_INT8)[0]
 
     def getUint16(self):
         """Unpack an ``UINT16``."""
-        return self.get(UINT16)
+        return self.unpack(_UINT16)[0]
 
     def getInt16(self):
         """Unpack an ``INT16``."""
-        return self.get(INT16)
+        return self.unpack(_INT16)[0]
 
     def getUint32(self):
         """Unpack an ``UINT32``."""
-        return self.get(UINT32)
+        return self.unpack(_UINT32)[0]
 
     def getInt32(self):
         """Unpack an ``INT32``."""
-        return self.get(INT32)
+        return self.unpack(_INT32)[0]
 
     def getFloat32(self):
         """Unpack an ``FLOAT32``."""
-        return self.get(FLOAT32)
+        return self.unpack(_FLOAT32)[0]
 
     def getUint64(self):
         """Unpack an ``UINT64``."""
-        return self.get(UINT64)
+        return self.unpack(_UINT64)[0]
 
     def getInt64(self):
         """Unpack an ``INT64``."""
-        return self.get(INT64)
+        return self.unpack(_INT64)[0]
 
     def getFloat64(self):
         """Unpack an ``FLOAT64``."""
-        return self.get(FLOAT64)
+        return self.unpack(_FLOAT64)[0]
+
+    def string_span(self, ctype=UINT16):
+        """
+        Skip a NUL terminated string returning where its characters
+        start and end.
+
+        The terminator is searched in bulk.
+
+        """
+        try:
+            chars, _ = STRINGS[ctype]
+        except KeyError:
+            raise ValueError("Unsupported string type %r" % ctype)
+        start = self.offset
+        end = chars.match(self.buf, start).end()
+        self.offset = end + compiled(ctype).size
+        if self.offset > len(self.buf):
+            raise struct.error("Unterminated string.")
+        return start, end
 
     def string(self, ctype=UINT16):
-        """Unpack a string."""
-        bls = struct.calcsize(ctype)
-        def _get():
-            """Generate the secuence of characters to the Null."""
-            while True:
-                d = struct.unpack_from(ctype, self.buf, offset=self.offset)[0]
-                self.offset += bls
-                if d == 0:
-                    break
-                else:
-                    yield d
-
-        return "".join(chr(c) for c in _get())
+        """Unpack a NUL terminated string, decoded in one go."""
+        start, end = self.string_span(ctype)
+        return str(self.buf[start:end], STRINGS[ctype][1], 'surrogatepass')
+
+    def name(self, names=None):
+        """
+        Unpack the name of a cell, interned in ``names`` (by default
+        ``NAMES``). Returns ``None`` if the name is empty.
+
+        """
+        start, end = self.string_span()
+        if start == end:
+            return None
+        else:
+            return (names or NAMES).intern(self.buf[start:end])
 
     @abstractmethod
     def parse(self):
@@ -123,51 +320,100 @@ class Status(BaseMSG):
     """
     def parse(self):
         """Unpacks the data."""
-        self.cells = []
-        self.eat = []
+        self.parse_eat()
+        self.parse_cells()
+        self.parse_dissapears()
 
+    def parse_eat(self):
+        """Unpacks who eats who."""
         self.num = self.getUint16()
-        for _ in range(self.num):
-            self.eat.append(Eat(eater=self.getUint32(),
-                                eatee=self.getUint32()))
-
-        _id = self.getUint32()
-        while _id != 0:
-            x = self.getInt32()
-            y = self.getInt32()
-            size = self.getInt16()
-
-            # Get Cell Color
-            color = "%06x" % (self.getUint8() << 16 |
-                              self.getUint8() << 8  |
-                              self.getUint8())
-
-            k = self.getUint8()
+        self.eat = [Eat._make(e) for e in self.unpack_many(EAT_RECORD,
+                                                            self.num)]
+
+    def parse_cells(self):
+        """Unpacks the visible cells."""
+        self.cells = []
+        record = self.cell_record()
+        while record is not None:
+            _id, x, y, size, r, g, b, k = record
+            color = r << 16 | g << 8 | b
             is_virus = bool(k & 1)
             # r = (k & 16)
+            self.skip_cell_extra(k)
 
-            if k & 2:
-                self.offset += 4
-            elif k & 4:
-                self.offset += 8
-            elif k & 8:
-                self.offset += 16
-
-            name = self.string() or None
+            name = self.name()
             self.cells.append(Cell(_id, x, y, size, color, is_virus, name))
+            record = self.cell_record()
 
-            _id = self.getUint32()
-
+    def parse_dissapears(self):
+        """Unpacks the cells that are not visible anymore."""
         self.balls_on_screen = self.getUint32()
-        self.dissapears = []
-        for _ in range(self.balls_on_screen):
-            self.dissapears.append(Dissapear(self.getUint32()))
+        self.dissapears = [Dissapear._make(d) for d in self.unpack_many(
+            _UINT32, self.balls_on_screen)]
+
+    def cell_record(self, record=CELL_RECORD):
+        """
+        Unpack the next cell ``record``, whose first field is the cell id.
+
+        Returns ``None`` when the terminator of the cell list is found.
+
+        """
+        if self.offset + record.size > len(self.buf):
+            # There is no room for another record, only the terminator
+            # is left.
+            if self.getUint32() == 0:
+                return None
+            raise struct.error("Truncated cell record.")
+
+        values = record.unpack_from(self.buf, self.offset)
+        if values[0] == 0:
+            self.offset += _UINT32.size
+            return None
+        else:
+            self.offset += record.size
+            return values
+
+    def skip_cell_extra(self, flags):
+        """Skips the optional data following a cell record."""
+        if flags & 2:
+            self.offset += 4
+        elif flags & 4:
+            self.offset += 8
+        elif flags & 8:
+            self.offset += 16
 
     def __repr__(self):
         return "Eat=%r\nCells=%r\nDissapears=%r\n" % (self.eat, self.cells,
                                                       self.dissapears)
 
 
+class LazyStatus(Status):
+    """
+    A ``Status`` which only decodes the eat list up front.
+
+    The cells and the dissapears are decoded the first time any of the
+    ``lazy`` attributes is accessed, and kept from then on.
+
+    """
+    lazy = ('cells', 'dissapears', 'balls_on_screen')
+
+    def parse(self):
+        """Unpacks the eat list and remembers where the cells start."""
+        self.parse_eat()
+        self.cells_offset = self.offset
+        self.decoded = False
+
+    def __getattr__(self, name):
+        if name in self.lazy and not self.__dict__.get('decoded', True):
+            self.decoded = True
+            self.offset = self.cells_offset
+            self.parse_cells()
+            self.parse_dissapears()
+            return getattr(self, name)
+        else:
+            raise AttributeError(name)
+
+
 class Leaderboard(BaseMSG):
     """
     The ``Leaderboard``.
@@ -200,7 +446,8 @@ class TeamsScore(BaseMSG):
     def parse(self):
         """Unpacks the data."""
         self.numteams = self.getUint32()
-        self.players = [self.getFloat32() for i in range(self.numteams)]
+        self.players = [p for (p,) in self.unpack_many(_FLOAT32,
+                                                       self.numteams)]
 
     def __repr__(self):
         return repr(self.players)
@@ -215,10 +462,7 @@ class ScreenAndCamera(BaseMSG):
     """
     def parse(self):
         """Unpacks the data."""
-        self.screen = Screen(x1=self.getFloat64(),
-                             y1=self.getFloat64(),
-                             x2=self.getFloat64(),
-                             y2=self.getFloat64())
+        self.screen = Screen._make(self.unpack(SCREEN_RECORD))
 
         self.camera = Camera(x=(self.screen.x2 + self.screen.x1) / 2,
                              y=(self.screen.y2 + self.screen.y1) / 2,
@@ -237,9 +481,7 @@ class CameraPosition(BaseMSG):
     """
     def parse(self):
         """Unpacks the data."""
-        self.camera = Camera(x=self.getFloat32(),
-                             y=self.getFloat32(),
-                             zoom=self.getFloat32())
+        self.camera = Camera._make(self.unpack(CAMERA_RECORD))
 
     def __repr__(self):
         return repr(self.camera)
@@ -275,8 +517,7 @@ class SetQARA(BaseMSG):
     """
     def parse(self):
         """Unpacks the data."""
-        self.ca = self.getInt16()
-        self.da = self.getInt16()
+        self.ca, self.da = self.unpack(QARA_RECORD)
         self.sa = True
 
 
@@ -301,28 +542,90 @@ class MSGType(Enum):
         return globals().get(self.name)
 
 
+class Decoders:
+    """
+    The parser of each message, indexed by its identifier.
+
+    Custom parsers can be ``register``-ed for any identifier. After
+    ``want`` only the messages of the given types are decoded, the rest
+    are skipped without even looking at the payload.
+
+    With ``columnar`` the ``Status`` cells are decoded into NumPy arrays
+    (see :mod:`pyagar.columnar`), and with ``lazy`` only when they are
+    looked at.
+
+    """
+    def __init__(self, columnar=False, lazy=False):
+        self.parsers = [None] * 256
+        self.active = [None] * 256
+        self.wanted = None
+        for msgtype in MSGType:
+            self.register(msgtype.value, msgtype.cls)
+        if columnar:
+            from pyagar.columnar import ColumnarStatus, LazyColumnarStatus
+            self.register(MSGType.Status,
+                          LazyColumnarStatus if lazy else ColumnarStatus)
+        elif lazy:
+            self.register(MSGType.Status, LazyStatus)
+
+    def register(self, msgtype, cls):
+        """Parse the messages with identifier ``msgtype`` with ``cls``."""
+        self.parsers[int(getattr(msgtype, 'value', msgtype))] = cls
+        self.refresh()
+
+    def want(self, types):
+        """
+        Decode only the messages parsed by subclasses of ``types`` (a
+        tuple of classes). If ``types`` is ``None`` everything is
+        decoded.
+
+        """
+        self.wanted = types
+        self.refresh()
+
+    def refresh(self):
+        """Recomputes the parsers in use."""
+        self.active = [
+            cls if (cls is not None and
+                    (self.wanted is None or issubclass(cls, self.wanted)))
+            else None
+            for cls in self.parsers]
+
+
+#: The default parsers.
+DECODERS = Decoders()
+
+
 class MSG(BaseMSG):
     """
     All messages.
 
     This class identify the specific message type and calls the proper
-    parser.
+    parser of ``decoders`` (by default ``DECODERS``).
+
+    If the message type is known but not wanted, ``data`` is ``None``
+    and ``skipped`` is ``True``.
 
     """
+    def __init__(self, buf, offset=0, decoders=None):
+        self.decoders = decoders or DECODERS
+        super().__init__(buf, offset)
+
     def parse(self):
         """Unpacks the message identifier and instantiate the parser."""
-        c = self.get("B")
+        c = self.getUint8()
         if c == 240:
             self.offset += 5
-            c = self.get("B")
+            c = self.getUint8()
 
         self.msgtype = c
-        try:
-            msgcls = MSGType(self.msgtype).cls
-        except ValueError:
+        msgcls = self.decoders.active[c]
+        if msgcls is None:
             self.data = None
+            self.skipped = self.decoders.parsers[c] is not None
         else:
             self.data = msgcls(self.buf, self.offset)
+            self.skipped = False
 
     def __repr__(self):
         if self.data is not None:
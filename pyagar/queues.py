@@ -0,0 +1,71 @@
+"""
+``pyagar.queues``
+=================
+
+The queues of the consumers.
+
+"""
+# pylint: disable=I0011,R0903
+import asyncio
+
+
+#: Overflow policies of ``MessageQueue``.
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+COALESCE = "coalesce"
+
+#: Default size of the consumers queues.
+QUEUE_SIZE = 64
+
+
+class MessageQueue(asyncio.Queue):
+    """
+    A bounded queue of messages with an ``overflow`` policy.
+
+    When the queue is full and a new message arrives:
+
+      * ``BLOCK``: the producer waits until there is room.
+      * ``DROP_OLDEST``: the oldest message is discarded.
+      * ``COALESCE``: the queued messages of the same type are discarded,
+        the new one supersedes them. If there are none, the oldest
+        message is discarded.
+
+    ``COALESCE`` is only safe for the consumers reading the state from
+    a :class:`pyagar.world.World`, which has already applied every
+    message, and not from the deltas carried by the messages.
+
+    ``dropped`` counts the discarded messages. Every discarded message
+    is marked as done, so ``join`` still works.
+
+    """
+    def __init__(self, maxsize=QUEUE_SIZE, overflow=BLOCK):
+        super().__init__(maxsize)
+        self.overflow = overflow
+        self.dropped = 0
+
+    @asyncio.coroutine
+    def push(self, item):
+        """Put ``item`` in the queue applying the overflow policy."""
+        if self.full():
+            if self.overflow == BLOCK:
+                yield from self.put(item)
+                return
+            elif self.overflow == COALESCE:
+                self.coalesce(type(item))
+            if self.full():
+                self.get_nowait()
+                self.task_done()
+                self.dropped += 1
+        self.put_nowait(item)
+
+    def coalesce(self, kind):
+        """Discards the queued messages of type ``kind``."""
+        queued = [self.get_nowait() for _ in range(self.qsize())]
+        for item in queued:
+            if type(item) is not kind:
+                self.put_nowait(item)
+        # Only now, so the count of unfinished tasks never reaches zero
+        # while there are messages left.
+        for _ in queued:
+            self.task_done()
+        self.dropped += len(queued) - self.qsize()
@@ -0,0 +1,899 @@
+"""
+``pyagar.recording``
+====================
+
+Recording and replay of the frames received from the server.
+
+A recording starts with ``MAGIC`` and contains one record per frame:
+the ``time.monotonic()`` of its arrival and its length (``HEADER``)
+followed by the raw frame. The frames are only decoded when replayed.
+
+Every few seconds there is also a keyframe record, flagged with
+``KEYFRAME`` in its length, containing the frames which rebuild the
+whole state of the world at that point. The commands sent to the server
+are stored too, flagged with ``OUTGOING``. The index of the keyframes is
+stored next to the recording (see ``index_filename``), so the replay can
+jump anywhere without playing everything before.
+
+"""
+# pylint: disable=I0011,C0103
+from collections import deque
+import asyncio
+import bisect
+import mmap
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+
+from pyagar import commands
+from pyagar.bus import Raw, Sent
+from pyagar.log import logger
+from pyagar.messages import MSG, MSGType, Decoders, compiled
+from pyagar.messages import Status, PlayerCell
+from pyagar.queues import MessageQueue, BLOCK, QUEUE_SIZE
+
+#: First bytes of every recording.
+MAGIC = b"PYAGAR\x00\x01"
+
+#: Timestamp and length of each record.
+HEADER = compiled("dI")
+
+#: Flag set in the length of the keyframe records.
+KEYFRAME = 0x80000000
+
+#: Flag set in the length of the commands sent.
+OUTGOING = 0x40000000
+
+#: All the flags of the length.
+FLAGS = KEYFRAME | OUTGOING
+
+#: Length of each frame inside a keyframe.
+LENGTH = compiled("I")
+
+#: Timestamp and offset of each keyframe in the index.
+INDEX_RECORD = compiled("dQ")
+
+#: Seconds between two keyframes.
+KEYFRAME_INTERVAL = 10
+
+#: Bytes written at once by the ``RecordingWriter``.
+BATCH_SIZE = 1 << 20
+
+#: Records waiting for the ``RecordingWriter`` at most.
+MAX_PENDING = 1 << 14
+
+#: Seconds between two syncs of the recording to disk.
+FSYNC_INTERVAL = 5
+
+#: Seconds kept in memory by the ``FlightRecorder``.
+FLIGHT_SECONDS = 30
+
+#: Seconds between two keyframes of the ``FlightRecorder``.
+FLIGHT_KEYFRAME_INTERVAL = 5
+
+#: Memory used by the ``FlightRecorder`` at most.
+FLIGHT_BYTES = 64 << 20
+
+#: Records read and decoded ahead of the replay.
+LOOKAHEAD = 256
+
+#: Seconds the replay can be late before coalescing frames.
+LAG_TOLERANCE = 0.1
+
+#: The messages only the last of which matters.
+SUPERSEDED = frozenset(t.value for t in (MSGType.CameraPosition,
+                                         MSGType.Leaderboard,
+                                         MSGType.TeamsScore))
+
+
+def index_filename(filename):
+    """The name of the index of the recording ``filename``."""
+    return filename + ".idx"
+
+
+def pack_frame(timestamp, frame):
+    """The record of ``frame`` received at ``timestamp``."""
+    return HEADER.pack(timestamp, len(frame)) + frame
+
+
+def pack_keyframe(timestamp, frames):
+    """The record of the keyframe made of ``frames``."""
+    payload = b"".join(LENGTH.pack(len(f)) + f for f in frames)
+    return HEADER.pack(timestamp, len(payload) | KEYFRAME) + payload
+
+
+def pack_command(timestamp, payload):
+    """The record of the command ``payload`` sent at ``timestamp``."""
+    return HEADER.pack(timestamp, len(payload) | OUTGOING) + payload
+
+
+def write_frame(fd, timestamp, frame):
+    """Appends ``frame`` received at ``timestamp`` to ``fd``."""
+    fd.write(pack_frame(timestamp, frame))
+
+
+def write_keyframe(fd, timestamp, frames):
+    """Appends the keyframe made of ``frames`` to ``fd``."""
+    fd.write(pack_keyframe(timestamp, frames))
+
+
+def split_keyframe(payload):
+    """The frames of a keyframe."""
+    frames = []
+    offset = 0
+    while offset < len(payload):
+        length, = LENGTH.unpack_from(payload, offset)
+        offset += LENGTH.size
+        frames.append(payload[offset:offset + length])
+        offset += length
+    return frames
+
+
+def check_magic(fd):
+    """Reads the ``MAGIC`` at the start of the recording ``fd``."""
+    if fd.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a pyagar recording, old recordings can be "
+                         "converted with ``pyagar convert``.")
+
+
+def read_records(fd):
+    """
+    Yields the (timestamp, kind, payload) of the records from the
+    current position of ``fd``. ``kind`` is the flag of the record,
+    ``0`` for the frames received. The payload of the ``KEYFRAME`` has
+    to be split with ``split_keyframe``.
+
+    A truncated last record, as left by an interrupted recording, is
+    ignored.
+
+    """
+    while True:
+        header = fd.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        timestamp, length = HEADER.unpack(header)
+        payload = fd.read(length & ~FLAGS)
+        if len(payload) < length & ~FLAGS:
+            return
+        yield timestamp, length & FLAGS, payload
+
+
+def read_frames(fd):
+    """
+    Yields the (timestamp, frame) of the frames of a recording, like
+    iterating a ``Recording``.
+
+    """
+    check_magic(fd)
+    started = False
+    for timestamp, kind, payload in read_records(fd):
+        if not kind:
+            started = True
+            yield timestamp, payload
+        elif kind == KEYFRAME and not started:
+            for frame in split_keyframe(payload):
+                yield timestamp, frame
+
+
+def build_index(filename):
+    """Returns the (timestamp, offset) of each keyframe of a recording."""
+    with Recording(filename) as recording:
+        return [(timestamp, offset)
+                for offset, timestamp, kind, _ in recording.records()
+                if kind == KEYFRAME]
+
+
+def load_index(filename):
+    """
+    Returns the index of the recording ``filename``, which is rebuilt
+    if it is missing.
+
+    """
+    try:
+        with open(index_filename(filename), 'rb') as fd:
+            data = fd.read()
+    except FileNotFoundError:
+        return build_index(filename)
+    else:
+        end = len(data) - len(data) % INDEX_RECORD.size
+        return list(INDEX_RECORD.iter_unpack(data[:end]))
+
+
+class Recording:
+    """
+    A recording mapped in memory.
+
+    Iterating it yields the (timestamp, frame) of every frame received,
+    without commands, as ``memoryview`` of the mapping: nothing is read
+    or copied until the frame is decoded. Only the frames of a keyframe
+    before the first frame, as the flight recorder dumps start, are
+    yielded: the later keyframes just restate what the frames did. It
+    is meant to be scanned outside of the event loop too::
+
+        with Recording(filename) as recording:
+            for timestamp, frame in recording:
+                msg = MSG(frame)
+
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as fd:
+            check_magic(fd)
+            self.map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Unmaps the recording, unless some frame is still in use."""
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # Unmapped when the last frame is released.
+            pass
+
+    def records(self, offset=len(MAGIC)):
+        """
+        Yields the (offset, timestamp, kind, payload) of the records
+        from ``offset``. See ``read_records``.
+
+        """
+        view = self.view
+        end = len(view)
+        while offset + HEADER.size <= end:
+            timestamp, length = HEADER.unpack_from(view, offset)
+            start = offset + HEADER.size
+            stop = start + (length & ~FLAGS)
+            if stop > end:
+                return
+            yield offset, timestamp, length & FLAGS, view[start:stop]
+            offset = stop
+
+    def __iter__(self):
+        started = False
+        for _, timestamp, kind, payload in self.records():
+            if not kind:
+                started = True
+                yield timestamp, payload
+            elif kind == KEYFRAME and not started:
+                for frame in split_keyframe(payload):
+                    yield timestamp, frame
+
+
+def convert(src, dst):
+    """
+    Converts the old pickled recording ``src`` into the recording
+    ``dst``. Returns the number of frames written.
+
+    """
+    count = 0
+    with open(src, 'rb') as src_fd, open(dst, 'wb') as dst_fd:
+        dst_fd.write(MAGIC)
+        while True:
+            try:
+                timestamp, data = pickle.load(src_fd)
+            except EOFError:
+                break
+            write_frame(dst_fd, timestamp, bytes(data.buf))
+            count += 1
+    return count
+
+
+class RecordingWriter(threading.Thread):
+    """
+    Writes a recording and its index from a background thread.
+
+    ``write`` never blocks: the records are queued and the thread
+    writes whatever is pending, up to ``batch_size`` bytes, with a single
+    call. The files are synced to disk every ``fsync_interval`` seconds
+    (never if ``None``).
+
+    ``depth`` is the number of records waiting, ``latency`` and
+    ``max_latency`` the seconds the records of the last batch (and of
+    any batch) waited to be written. When ``max_pending`` records are
+    already waiting, or after an error writing (in ``error``), the
+    records are dropped and counted in ``dropped``.
+
+    ``close`` must be called to write the records still waiting.
+
+    """
+    def __init__(self, filename, batch_size=BATCH_SIZE,
+                 fsync_interval=FSYNC_INTERVAL, max_pending=MAX_PENDING):
+        super().__init__(name="RecordingWriter", daemon=True)
+        self.filename = filename
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.closing = False
+        self.latency = self.max_latency = 0
+        self.batches = self.written = self.dropped = 0
+        self.error = None
+
+    @property
+    def depth(self):
+        """Records waiting to be written."""
+        return self.pending.qsize()
+
+    def write(self, record, index=b""):
+        """
+        Queues ``record`` and its ``index`` entry, if any. Returns
+        whether it was queued.
+
+        """
+        if self.error is None:
+            try:
+                self.pending.put_nowait((time.monotonic(), record, index))
+            except queue.Full:
+                if not self.dropped:
+                    logger.warning("The disk can't keep up with the "
+                                   "recording, dropping frames.")
+            else:
+                return True
+        self.dropped += 1
+        return False
+
+    def close(self):
+        """Writes everything pending and waits for the thread."""
+        while self.is_alive():
+            try:
+                self.pending.put(None, timeout=0.1)
+            except queue.Full:
+                continue
+            self.join()
+
+    def batch(self):
+        """Returns the next records to write, ``None`` when closed."""
+        if self.closing:
+            return None
+        item = self.pending.get()
+        if item is None:
+            return None
+        batch = [item]
+        size = len(item[1])
+        while size < self.batch_size:
+            try:
+                item = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.closing = True
+                break
+            batch.append(item)
+            size += len(item[1])
+        return batch
+
+    def run(self):
+        try:
+            with open(self.filename, 'wb', buffering=0) as fd, \
+                    open(index_filename(self.filename), 'wb',
+                         buffering=0) as index:
+                last_sync = time.monotonic()
+                for batch in iter(self.batch, None):
+                    fd.write(b"".join(record for _, record, _ in batch))
+                    entries = b"".join(entry for _, _, entry in batch)
+                    if entries:
+                        index.write(entries)
+
+                    now = time.monotonic()
+                    if (self.fsync_interval is not None and
+                            now - last_sync >= self.fsync_interval):
+                        os.fsync(fd.fileno())
+                        os.fsync(index.fileno())
+                        last_sync = now
+
+                    self.latency = now - batch[0][0]
+                    self.max_latency = max(self.max_latency, self.latency)
+                    self.batches += 1
+                    self.written += len(batch)
+        except OSError as exc:
+            logger.error("Can't write the recording, stopped: %s", exc)
+            self.error = exc
+
+
+class GameplaySaver:
+    """
+    Store the gameplay frames in a recording.
+
+    With a ``world`` a keyframe of its state is stored every
+    ``keyframe_interval`` seconds, and its offset in the index. The
+    commands sent by the client are stored too.
+
+    The files are written by a ``RecordingWriter`` so the event loop
+    never waits for the disk; ``stats`` tells how it is doing. If the
+    disk fails the recording stops, but not the game. ``close`` writes
+    what is still pending.
+
+    """
+    wants = (Raw, Sent)
+
+    def __init__(self, filename, world=None,
+                 keyframe_interval=KEYFRAME_INTERVAL,
+                 fsync_interval=FSYNC_INTERVAL):
+        self.messages = MessageQueue(maxsize=1024, overflow=BLOCK)
+        self.filename = filename
+        self.world = world
+        self.keyframe_interval = keyframe_interval
+        self.writer = RecordingWriter(filename,
+                                      fsync_interval=fsync_interval)
+
+    @property
+    def stats(self):
+        """Depth of the writer queue and write latencies, in seconds."""
+        return {'depth': self.writer.depth,
+                'latency': self.writer.latency,
+                'max_latency': self.writer.max_latency,
+                'dropped': self.writer.dropped}
+
+    def close(self):
+        """Writes the records pending and closes the recording."""
+        self.writer.close()
+
+    @asyncio.coroutine
+    def run(self):
+        self.writer.start()
+        try:
+            self.writer.write(MAGIC)
+            offset = len(MAGIC)
+            last_keyframe = time.monotonic()
+            keyframe = None
+            while True:
+                frame = yield from self.messages.get()
+                if self.writer.error is not None:
+                    # Stopped recording, the rest of the game goes on.
+                    continue
+                now = time.monotonic()
+                if isinstance(frame, Sent):
+                    record = pack_command(now, frame)
+                else:
+                    record = pack_frame(now, frame)
+                if self.writer.write(record):
+                    offset += len(record)
+
+                if keyframe is not None:
+                    behind -= 1
+                elif (self.world is not None and
+                      now - last_keyframe >= self.keyframe_interval):
+                    # The world has already applied the frames still
+                    # queued, so the keyframe is written after them.
+                    keyframe = pack_keyframe(now, self.world.snapshot())
+                    behind = self.messages.qsize()
+                    last_keyframe = now
+                if keyframe is not None and not behind:
+                    if self.writer.write(keyframe,
+                                         INDEX_RECORD.pack(last_keyframe,
+                                                           offset)):
+                        offset += len(keyframe)
+                    keyframe = None
+        finally:
+            self.close()
+
+
+def save_records(filename, records):
+    """Writes a recording made of ``records``, already packed."""
+    with open(filename, 'wb') as fd:
+        fd.write(MAGIC)
+        fd.writelines(records)
+    logger.info("Recording saved in %s.", filename)
+
+
+class FlightRecorder:
+    """
+    Keeps in memory the frames of the last ``seconds`` and saves them in
+    a new recording in ``directory`` when the player dies (its last cell
+    is eaten) or on ``SIGUSR1``.
+
+    The frames are kept in segments of ``keyframe_interval`` seconds,
+    each one starting with a keyframe of ``world`` if there is one, and
+    the oldest segments are discarded as soon as they are not needed or
+    they take more than ``max_bytes``. The deaths are only noticed with
+    a ``world``.
+
+    """
+    wants = (Raw, Status, PlayerCell)
+
+    def __init__(self, directory, seconds=FLIGHT_SECONDS, world=None,
+                 keyframe_interval=FLIGHT_KEYFRAME_INTERVAL,
+                 max_bytes=FLIGHT_BYTES):
+        self.messages = MessageQueue(maxsize=1024, overflow=BLOCK)
+        self.directory = directory
+        self.seconds = seconds
+        self.world = world
+        self.keyframe_interval = keyframe_interval
+        self.max_bytes = max_bytes
+        #: The (start, records) of each segment.
+        self.segments = deque()
+        self.size = 0
+        #: The cells of the player in the world after the last message.
+        self.owned = set()
+        self.dumps = 0
+
+    def record(self, frame):
+        """Keeps ``frame``."""
+        now = time.monotonic()
+        if not self.segments:
+            self.segments.append((now, []))
+        self.keep(pack_frame(now, frame))
+
+    def roll(self):
+        """
+        Starts a new segment if it is time, discarding the segments not
+        needed anymore.
+
+        """
+        now = time.monotonic()
+        if now - self.segments[-1][0] < self.keyframe_interval:
+            return
+        self.segments.append((now, []))
+        if self.world is not None:
+            self.keep(pack_keyframe(now, self.world.snapshot()))
+
+        cutoff = now - self.seconds
+        while len(self.segments) > 1 and (self.segments[1][0] <= cutoff or
+                                          self.size > self.max_bytes):
+            _, records = self.segments.popleft()
+            self.size -= sum(len(r) for r in records)
+
+    def keep(self, record):
+        """Appends ``record`` to the current segment."""
+        self.segments[-1][1].append(record)
+        self.size += len(record)
+
+    def track(self, data):
+        """Dumps when the last cell of the player is eaten by ``data``."""
+        owned, self.owned = self.owned, set(self.world.owned)
+        if (isinstance(data, Status) and owned and not self.owned and
+                owned.intersection(e.eatee for e in data.eat)):
+            self.dump("death")
+
+    def dump(self, reason):
+        """Saves the frames in memory, from another thread."""
+        self.dumps += 1
+        filename = os.path.join(self.directory, "flight-%s-%d-%d.rec" % (
+            reason, time.time(), self.dumps))
+        records = [r for _, segment in self.segments for r in segment]
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(None, save_records, filename, records)
+
+    @asyncio.coroutine
+    def run(self):
+        loop = asyncio.get_event_loop()
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, self.dump, "signal")
+        except (AttributeError, NotImplementedError):
+            logger.warning("The flight recorder can't be dumped on signal.")
+
+        while True:
+            data = yield from self.messages.get()
+            if isinstance(data, memoryview):
+                self.record(data)
+            elif self.world is not None:
+                self.track(data)
+
+            # The world is up to date with the frames kept only when
+            # there are no more of them queued.
+            if self.segments and self.messages.empty():
+                self.roll()
+
+
+class Prefetcher(threading.Thread):
+    """
+    Reads and decodes the records of a ``Recording`` ahead of the
+    replay, in a background thread.
+
+    At most ``lookahead`` records are kept ready, as (timestamp,
+    keyframe, payload, msg) where ``msg`` is the decoded frame (``None``
+    for the keyframes). ``restart`` moves it to another offset, the
+    records already read are discarded.
+
+    """
+    #: Returned by ``get`` after the last record.
+    END = None
+
+    def __init__(self, recording, decoders, lookahead=LOOKAHEAD):
+        super().__init__(name="Prefetcher", daemon=True)
+        self.recording = recording
+        self.decoders = decoders
+        self.ready = queue.Queue(maxsize=lookahead)
+        self.restarts = queue.Queue()
+        self.generation = 0
+
+    def restart(self, offset):
+        """Reads from ``offset`` on."""
+        self.generation += 1
+        self.restarts.put((offset, self.generation))
+
+    def stop(self):
+        """
+        Stops the thread, and wakes up whoever waits in ``get``. Returns
+        when the thread is done with the recording.
+
+        """
+        self.restarts.put(None)
+        try:
+            self.ready.put_nowait((self.generation, self.END))
+        except queue.Full:
+            pass
+        if self.is_alive():
+            self.join()
+
+    def get(self, block=True):
+        """
+        The next record ready. Blocks until there is one unless
+        ``block`` is false, then ``queue.Empty`` may be raised.
+
+        """
+        while True:
+            generation, record = self.ready.get(block)
+            if generation == self.generation:
+                return record
+
+    def decode(self, payload):
+        """Decodes the frame ``payload`` completely."""
+        msg = MSG(payload, decoders=self.decoders)
+        for name in getattr(msg.data, 'lazy', ()):
+            getattr(msg.data, name)
+        return msg
+
+    def offer(self, item):
+        """
+        Puts ``item`` in ``ready`` as soon as there is room. Returns
+        ``False`` if there is a restart pending instead.
+
+        """
+        while self.restarts.empty():
+            try:
+                self.ready.put(item, timeout=0.05)
+            except queue.Full:
+                continue
+            else:
+                return True
+        return False
+
+    def run(self):
+        offset, generation = len(MAGIC), 0
+        while True:
+            for _, timestamp, kind, payload in self.recording.records(
+                    offset):
+                if kind == OUTGOING:
+                    continue
+                msg = None if kind else self.decode(payload)
+                if not self.offer((generation,
+                                   (timestamp, bool(kind), payload, msg))):
+                    break
+            else:
+                self.offer((generation, self.END))
+
+            restart = self.restarts.get()
+            if restart is None:
+                return
+            offset, generation = restart
+
+
+class GameReplay:
+    """
+    Replay the frames saved with ``GameplaySaver``.
+
+    Like the ``Client``, queues them as ``MSG`` decoded with
+    ``decoders``.
+
+    ``seek`` jumps forwards or backwards in the recording: ``world`` is
+    cleared and restored from the nearest keyframe before the target,
+    then the frames up to the target are queued without waiting.
+
+    The time between frames is divided by ``speed``. With an infinite
+    ``speed`` the frames are queued as fast as they are consumed.
+
+    Each frame is due at a deadline computed from the start of the
+    playback, so the delays do not add up. While the replay is more than
+    ``LAG_TOLERANCE`` late (or seeking), the frames in ``SUPERSEDED``
+    are held back and only the last one of each type is queued when it
+    is on time again. ``lag``, ``max_lag`` and ``coalesced`` tell how
+    it went.
+
+    The frames are read and decoded ahead by a ``Prefetcher``, up to
+    ``lookahead`` of them, so playing them is just handing them out.
+
+    """
+    def __init__(self, filename, columnar=False, world=None, speed=1,
+                 lookahead=LOOKAHEAD):
+        self.messages = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.speed = speed
+        self.lookahead = lookahead
+        self.decoders = Decoders(columnar=columnar, lazy=True)
+        self.raw = False
+        self.filename = filename
+        self.world = world
+        self.index = []
+        #: Timestamp of the last frame queued.
+        self.position = None
+        self.target = None
+        self.seeking = asyncio.Event()
+        #: When the frame with timestamp ``base`` was due.
+        self.origin = self.base = None
+        self.held = {}
+        self.lag = self.max_lag = 0
+        self.coalesced = 0
+
+    def seek(self, offset):
+        """Jumps ``offset`` seconds, backwards if negative."""
+        if self.position is not None:
+            self.target = self.position + offset
+            self.seeking.set()
+
+    def restart(self):
+        """
+        Returns the offset of the keyframe before the target, or ``None``
+        if it is better to go on.
+
+        """
+        i = bisect.bisect_right(self.index, (self.target, float('inf')))
+        keyframe = self.index[i - 1] if i else None
+        if self.target >= self.position and (keyframe is None or
+                                             keyframe[0] <= self.position):
+            # Going on is closer than restoring a keyframe.
+            return None
+
+        while not self.messages.empty():
+            self.messages.get_nowait()
+            self.messages.task_done()
+        self.held.clear()
+        if self.world is not None:
+            self.world.clear()
+        self.position = None
+        return keyframe[1] if keyframe is not None else len(MAGIC)
+
+    @asyncio.coroutine
+    def wait(self, delay):
+        """Sleeps ``delay`` seconds or until a seek is requested."""
+        if delay > 0:
+            try:
+                yield from asyncio.wait_for(self.seeking.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    @asyncio.coroutine
+    def schedule(self, timestamp):
+        """
+        Waits until the frame with ``timestamp`` is due. Returns whether
+        the replay is late.
+
+        """
+        if self.target is not None:
+            return True
+        elif self.speed == float('inf'):
+            return False
+
+        loop = asyncio.get_event_loop()
+        if self.origin is None:
+            self.origin, self.base = loop.time(), timestamp
+        deadline = self.origin + (timestamp - self.base) / self.speed
+        yield from self.wait(deadline - loop.time())
+
+        lag = max(loop.time() - deadline, 0)
+        if lag > LAG_TOLERANCE >= self.lag:
+            logger.warning("Replay %.2f seconds late.", lag)
+        elif self.lag > LAG_TOLERANCE >= lag:
+            logger.info("Replay on time again (%d frames coalesced).",
+                        self.coalesced)
+        self.lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        return lag > LAG_TOLERANCE
+
+    @asyncio.coroutine
+    def queue(self, msg):
+        """Queues the decoded frame ``msg``."""
+        if msg.data is not None or self.raw:
+            yield from self.messages.put(msg)
+
+    @asyncio.coroutine
+    def run(self):
+        self.index = load_index(self.filename)
+        # A keyframe before the first frame (see ``FlightRecorder``) is
+        # the initial state.
+        restore = True
+        loop = asyncio.get_event_loop()
+        with Recording(self.filename) as recording:
+            prefetcher = Prefetcher(recording, self.decoders,
+                                    lookahead=self.lookahead)
+            prefetcher.start()
+            try:
+                while True:
+                    try:
+                        record = prefetcher.get(block=False)
+                    except queue.Empty:
+                        record = yield from loop.run_in_executor(
+                            None, prefetcher.get)
+                    if record is Prefetcher.END:
+                        break
+                    timestamp, keyframe, payload, msg = record
+                    if keyframe and not restore:
+                        continue
+                    restore = False
+
+                    if self.target is not None and timestamp >= self.target:
+                        self.target = self.origin = None
+                    late = yield from self.schedule(timestamp)
+
+                    if self.seeking.is_set():
+                        self.seeking.clear()
+                        offset = self.restart()
+                        if offset is not None:
+                            prefetcher.restart(offset)
+                            restore = True
+                            continue
+
+                    self.position = timestamp
+                    if keyframe:
+                        for frame in split_keyframe(payload):
+                            yield from self.queue(
+                                MSG(frame, decoders=self.decoders))
+                    elif (late and not self.raw and
+                          msg.msgtype in SUPERSEDED):
+                        self.coalesced += msg.msgtype in self.held
+                        self.held[msg.msgtype] = msg
+                    else:
+                        if not late:
+                            for held in self.held.values():
+                                yield from self.queue(held)
+                            self.held.clear()
+                        yield from self.queue(msg)
+
+                for held in self.held.values():
+                    yield from self.queue(held)
+            finally:
+                prefetcher.stop()
+
+        logger.info("Replay finished, %.2f seconds late at most "
+                    "(%d frames coalesced).", self.max_lag, self.coalesced)
+
+        # Let the last frames be delivered.
+        yield from self.messages.join()
+
+
+class OfflineClient:
+    """
+    Stands for the ``Client`` of the bots when replaying: their commands
+    are counted and logged, not sent.
+
+    """
+    def __init__(self, nick=None, columnar=False):
+        self.nick = nick
+        self.columnar = columnar
+        self.sent = 0
+
+    def enqueue(self, payload):
+        """Counts the command ``payload``."""
+        logger.debug("Command %r not sent.", bytes(payload))
+        self.sent += 1
+
+    def set_move(self, x, y):
+        """Counts the movement command."""
+        self.enqueue(commands.move(x, y))
+
+    @asyncio.coroutine
+    def spawn(self):
+        """Counts the ``spawn`` command."""
+        self.enqueue(commands.spawn(self.nick or ""))
+
+    @asyncio.coroutine
+    def move(self, x, y):
+        """Counts the ``movement`` command."""
+        self.set_move(x, y)
+
+    @asyncio.coroutine
+    def split(self):
+        """Counts the ``split`` command."""
+        self.enqueue(commands.SPLIT)
+
+    @asyncio.coroutine
+    def eject(self):
+        """Counts the ``eject`` command."""
+        self.enqueue(commands.EJECT)
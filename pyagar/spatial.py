@@ -0,0 +1,160 @@
+"""
+``pyagar.spatial``
+==================
+
+Spatial index of the cells.
+
+All the queries accept the same filters:
+
+  * ``exclude``: collection of cell ids to leave out.
+  * ``virus``: if not ``None`` only viruses (``True``) or only
+    non-viruses (``False``).
+  * ``bigger_than`` / ``smaller_than``: size limits (exclusive).
+
+"""
+# pylint: disable=I0011,C0103
+from collections import defaultdict
+import heapq
+import math
+
+#: Side of the grid squares, in game units.
+STEP = 256
+
+
+def manhattan(cell, x, y):
+    """Manhattan distance from ``cell`` to (``x``, ``y``)."""
+    return abs(cell.x - x) + abs(cell.y - y)
+
+
+def matcher(exclude=(), virus=None, bigger_than=None, smaller_than=None):
+    """Returns a predicate implementing the query filters."""
+    def match(cell):
+        """Whether ``cell`` passes the filters."""
+        return (cell.id not in exclude and
+                (virus is None or cell.is_virus == virus) and
+                (bigger_than is None or cell.size > bigger_than) and
+                (smaller_than is None or cell.size < smaller_than))
+    return match
+
+
+class Grid:
+    """
+    Uniform grid of squares of side ``step``.
+
+    Kept up to date with ``update`` and ``remove`` as the cells move,
+    appear and dissapear.
+
+    """
+    def __init__(self, step=STEP):
+        self.step = step
+        self.squares = defaultdict(dict)
+        self.where = {}
+        self.bounds = None
+
+    def square(self, x, y):
+        """The square containing (``x``, ``y``)."""
+        return (int(x // self.step), int(y // self.step))
+
+    def update(self, cell):
+        """Insert or move ``cell``."""
+        square = self.square(cell.x, cell.y)
+        old = self.where.get(cell.id)
+        if old != square:
+            if old is not None:
+                self.discard(old, cell.id)
+            self.where[cell.id] = square
+            self.grow(square)
+        self.squares[square][cell.id] = cell
+
+    def remove(self, _id):
+        """Removes the cell ``_id`` if present."""
+        square = self.where.pop(_id, None)
+        if square is not None:
+            self.discard(square, _id)
+
+    def discard(self, square, _id):
+        """Removes the cell ``_id`` from ``square``."""
+        cells = self.squares[square]
+        del cells[_id]
+        if not cells:
+            del self.squares[square]
+
+    def grow(self, square):
+        """Extend the bounds of the grid to contain ``square``."""
+        i, j = square
+        if self.bounds is None:
+            self.bounds = (i, j, i, j)
+        else:
+            i1, j1, i2, j2 = self.bounds
+            self.bounds = (min(i, i1), min(j, j1), max(i, i2), max(j, j2))
+
+    def __len__(self):
+        return len(self.where)
+
+    def ring(self, ci, cj, r):
+        """The cells in the squares at distance ``r`` of (``ci``, ``cj``)."""
+        if r == 0:
+            squares = [(ci, cj)]
+        else:
+            squares = ([(ci + d, cj - r) for d in range(-r, r + 1)] +
+                       [(ci + d, cj + r) for d in range(-r, r + 1)] +
+                       [(ci - r, cj + d) for d in range(-r + 1, r)] +
+                       [(ci + r, cj + d) for d in range(-r + 1, r)])
+        for square in squares:
+            cells = self.squares.get(square)
+            if cells:
+                yield from cells.values()
+
+    def knearest(self, x, y, k=1, **filters):
+        """
+        The ``k`` cells closest (manhattan) to (``x``, ``y``), nearest
+        first.
+
+        """
+        if self.bounds is None:
+            return []
+        match = matcher(**filters)
+        ci, cj = self.square(x, y)
+        i1, j1, i2, j2 = self.bounds
+        last = max(ci - i1, i2 - ci, cj - j1, j2 - cj)
+
+        best = []
+        for r in range(0, last + 1):
+            for cell in self.ring(ci, cj, r):
+                if match(cell):
+                    entry = (-manhattan(cell, x, y), cell.id, cell)
+                    if len(best) < k:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+            # Cells in the next rings are at least this far.
+            if len(best) == k and -best[0][0] <= r * self.step:
+                break
+        return [cell for _, _, cell in sorted(best, reverse=True)]
+
+    def within_rect(self, x1, y1, x2, y2, **filters):
+        """The cells inside the rectangle (``x1``, ``y1``, ``x2``, ``y2``)."""
+        match = matcher(**filters)
+        i1, j1 = self.square(x1, y1)
+        i2, j2 = self.square(x2, y2)
+        found = []
+        for i in range(i1, i2 + 1):
+            for j in range(j1, j2 + 1):
+                for cell in self.squares.get((i, j), {}).values():
+                    if (x1 <= cell.x <= x2 and y1 <= cell.y <= y2 and
+                            match(cell)):
+                        found.append(cell)
+        return found
+
+    def within_radius(self, x, y, radius, **filters):
+        """The cells at less than ``radius`` of (``x``, ``y``)."""
+        return [c for c in self.within_rect(x - radius, y - radius,
+                                            x + radius, y + radius,
+                                            **filters)
+                if math.hypot(c.x - x, c.y - y) < radius]
+
+    def filter(self, **filters):
+        """All the cells passing ``filters``."""
+        match = matcher(**filters)
+        return [cell for cells in self.squares.values()
+                for cell in cells.values() if match(cell)]
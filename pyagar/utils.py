@@ -8,27 +8,58 @@ Non categorized stuff.
 # pylint: disable=I0011,R0903
 import asyncio
 import atexit
-import pickle
-import time
 
 from pyagar.log import logger
+from pyagar.queues import MessageQueue, BLOCK, DROP_OLDEST, COALESCE
+from pyagar.queues import QUEUE_SIZE  # noqa
 
 
 @asyncio.coroutine
 def hub(src, *dsts):
-    """Broadcasts msgs from ``src.messages`` to all ``dsts.messages``."""
-    src_q = src.messages
-    dst_qs = [d.messages for d in dsts]
+    """
+    Delivers the msgs from ``src.messages`` to all ``dsts.messages``.
+
+    Each destination is subscribed to the message types listed in its
+    ``wants`` attribute (all of them if it is ``None`` or missing). See
+    :class:`pyagar.bus.Bus`.
+
+    """
+    from pyagar.bus import Bus
+    bus = Bus(src)
+    for dst in dsts:
+        bus.subscribe(dst)
+    yield from bus.run()
+
+
+@asyncio.coroutine
+def monitor(*consumers, interval=10):
+    """
+    Logs the depth and the drops of the queue of each consumer, and its
+    ``stats`` if any.
+
+    """
     while True:
-        data = yield from src_q.get()
-        for queue in dst_qs:
-            queue.put_nowait(data)
+        yield from asyncio.sleep(interval)
+        for consumer in consumers:
+            queue = consumer.messages
+            logger.debug("%s queue: depth=%d dropped=%d",
+                         consumer.__class__.__name__,
+                         queue.qsize(),
+                         getattr(queue, 'dropped', 0))
+            stats = getattr(consumer, 'stats', None)
+            if stats:
+                logger.debug("%s stats: %s",
+                             consumer.__class__.__name__,
+                             " ".join("%s=%.3g" % s
+                                      for s in sorted(stats.items())))
 
 
 class Output:
     """Prints every message received."""
+    wants = None
+
     def __init__(self):
-        self.messages = asyncio.Queue()
+        self.messages = MessageQueue(overflow=DROP_OLDEST)
 
     @asyncio.coroutine
     def run(self):
@@ -38,57 +69,6 @@ class Output:
             logger.debug(data)
 
 
-class GameplaySaver:
-    """Store the gameplay messages in a file with a timestamp."""
-    def __init__(self, filename):
-        self.messages = asyncio.Queue()
-        self.filename = filename
-
-    @asyncio.coroutine
-    def run(self):
-        with open(self.filename, 'wb') as fd:
-            while True:
-                data = yield from self.messages.get()
-                pickle.dump((time.monotonic(), data), fd)
-
-
-class GameReplay:
-    """Replay the messages saved with ``GameplaySaver``."""
-    def __init__(self, filename):
-        self.messages = asyncio.Queue()
-        self.filename = filename
-        self.fd = None
-        self.last = None
-
-    def unpack_next(self):
-        try:
-            data = pickle.load(self.fd)
-        except EOFError:
-            return (None, None)
-        else:
-            timestamp, msg = data
-
-            if self.last is None:
-                delay = 0
-            else:
-                delay = timestamp - self.last
-
-            self.last = timestamp
-
-            return (delay, msg)
-
-    @asyncio.coroutine
-    def run(self):
-        with open(self.filename, 'rb') as self.fd:
-            while True:
-                delta, data = self.unpack_next()
-                if data is None:
-                    break
-                else:
-                    yield from asyncio.sleep(delta)
-                    yield from self.messages.put(data)
-
-
 def print_regions(regions):
     """Prints a pretty table with the region data."""
     from tabulate import tabulate
@@ -96,3 +76,7 @@ def print_regions(regions):
     table = [[k, v["numServers"], v["numRealms"], v["numPlayers"]]
              for k, v in sorted(regions.items())]
     print(tabulate(table, headers, tablefmt="rst"))
+
+
+# Moved to pyagar.recording, still importable from here.
+from pyagar.recording import GameplaySaver, GameReplay  # noqa
@@ -21,16 +21,21 @@ try:
 except ImportError:
     warnings.warn("Can't import pysdl2. The visualizer is not available.")
 
+from pyagar import commands
 from pyagar.log import logger
 from pyagar.messages import Camera
-from pyagar.messages import Status
 from pyagar.messages import ScreenAndCamera
 from pyagar.messages import CameraPosition
-from pyagar.messages import PlayerCell
 from pyagar.messages import Leaderboard
+from pyagar.utils import MessageQueue, COALESCE
+from pyagar.world import World
 
 FRAME_RATE = 60
 
+#: Seconds to jump with the seek and the skip keys of the replay.
+SEEK_STEP = 10
+SKIP_STEP = 60
+
 HERE = os.path.realpath(os.path.dirname(__file__))
 
 FONT_PATH = os.path.join(HERE, 'static', 'Ubuntu-R.ttf')
@@ -66,14 +71,25 @@ class Visualizer:
     """
     SDL based visualizer.
 
+    The cells are read from ``world``, a :class:`pyagar.world.World`
+    which may be shared with other consumers. When it is ``columnar``
+    the cells are translated to stage coordinates all at once.
+
+    With a ``replay`` (:class:`pyagar.recording.GameReplay`) the arrow
+    keys seek through the recording.
+
     """
-    def __init__(self, client, view_only=False, hardware=True):
-        self.names = dict()
-        self.messages = asyncio.Queue()
+    wants = (ScreenAndCamera, CameraPosition, Leaderboard)
+
+    def __init__(self, client, view_only=False, hardware=True,
+                 columnar=False, world=None, replay=None):
+        self.messages = MessageQueue(overflow=COALESCE)
         self.client = client
         self.view_only = view_only
-        self.players = dict()
-        self.player_id = None
+        self.replay = replay
+        if world is None:
+            world = World(columnar=columnar)
+        self.world = world
 
         self.renderer = None
         if hardware:
@@ -116,6 +132,21 @@ class Visualizer:
 
         self.leaderboard = None
 
+    @property
+    def players(self):
+        """The visible cells."""
+        return self.world.cells
+
+    @property
+    def names(self):
+        """The names of the visible cells."""
+        return self.world.names
+
+    @property
+    def player_id(self):
+        """The id of the player main cell."""
+        return self.world.player_id
+
     def update_leaderboard(self, data):
         lines = []
 
@@ -245,7 +276,7 @@ class Visualizer:
 
     def tr_win2game_coords(self, x, y):
         """Translate from window coords to game coordinates."""
-        cell = self.players.get(self.player_id)
+        cell = self.world.player
         if cell is None:
             return None
         else:
@@ -341,6 +372,25 @@ class Visualizer:
 
         return sdl2.SDL_Rect(x, y, w, h)
 
+    def visible_cells(self):
+        """
+        Returns the cells in drawing order (viruses last) along with
+        their position and size in the stage.
+
+        """
+        if self.world.columnar:
+            cells = self.players.select().drawing_order()
+            xs, ys, sizes = cells.stage_coords(self.gamescreen,
+                                               self.stage_w,
+                                               self.stage_h)
+            return zip(cells, xs.tolist(), ys.tolist(), sizes.tolist())
+        else:
+            cells = sorted(self.players.values(),
+                           key=lambda c: (int(c.is_virus), c.size))
+            return ((cell,) + self.tr_game2stage_coords(cell.x, cell.y) +
+                    (self.tr_game2stage_size(cell.size),)
+                    for cell in cells)
+
     @staticmethod
     def hex2color(h):
         i = int(h, base=16)
@@ -371,7 +421,7 @@ class Visualizer:
              ``stage`` to ``window``.
 
         """
-        main = self.players.get(self.player_id)
+        main = self.world.player
         if main:
             self.camera = Camera(main.x, main.y, 0.085)
 
@@ -384,10 +434,8 @@ class Visualizer:
         sdl2.SDL_RenderClear(self.renderer)
 
         # Draw the cells (Viruses last)
-        cells = sorted(self.players.values(),
-                       key=lambda c: (int(c.is_virus), c.size))
-        for cell in cells:
-            if cell.id == self.player_id:
+        for cell, x, y, size in self.visible_cells():
+            if cell.id in self.world.owned:
                 if self.client is not None:
                     label = self.client.nick
                 else:
@@ -395,20 +443,8 @@ class Visualizer:
             else:
                 label = self.names.get(cell.id)
 
-            x, y = self.tr_game2stage_coords(cell.x, cell.y)
-            size = self.tr_game2stage_size(cell.size)
-
-            # Cell border
-            fill_color = int('ff' + cell.color, base=16)
-
-            r = int(cell.color[:2], base=16)
-            g = int(cell.color[2:4], base=16)
-            b = int(cell.color[4:], base=16)
-            border_color = int('ff%0.2x%0.2x%0.2x' %
-                               (r - 0x10 if r > 0x10 else 0,
-                                g - 0x10 if g > 0x10 else 0,
-                                b - 0x10 if b > 0x10 else 0),
-                               base=16)
+            fill_color = 0xff000000 | cell.color
+            border_color = 0xff000000 | cell.border
 
             if cell.is_virus:
                 border_size = int(size / 5)
@@ -550,6 +586,11 @@ class Visualizer:
 
         self.last = time.monotonic()
 
+        seek_keys = {sdl2.SDLK_LEFT: -SEEK_STEP,
+                     sdl2.SDLK_RIGHT: SEEK_STEP,
+                     sdl2.SDLK_DOWN: -SKIP_STEP,
+                     sdl2.SDLK_UP: SKIP_STEP}
+
         self.create_window()
 
         # Window creation, we wait for a ScreenAndCamera message.
@@ -568,25 +609,10 @@ class Visualizer:
             except asyncio.TimeoutError:
                 data = None
 
-            if isinstance(data, PlayerCell):
-                self.player_id = data.cell.id
-            elif isinstance(data, CameraPosition):
+            if isinstance(data, CameraPosition):
                 self.camera = data.camera
             elif isinstance(data, Leaderboard):
                 self.update_leaderboard(data)
-            elif isinstance(data, Status):
-                for cell in data.cells:
-                    self.players[cell.id] = cell
-                    if cell.name:
-                        self.names[cell.id] = cell.name
-                for cell in data.dissapears:
-                    if cell.id in self.players:
-                        del self.players[cell.id]
-                for eats in data.eat:
-                    if eats.eatee == self.player_id:
-                        self.player_id = None
-                    if eats.eatee in self.players:
-                        del self.players[eats.eatee]
 
             # Read sdl events
             for event in sdl2.ext.get_events():
@@ -617,14 +643,20 @@ class Visualizer:
                         self.user_zoom = -50
                     else:
                         logger.debug("UserZoom: %r", self.user_zoom)
+                if (self.replay is not None and
+                        event.type == sdl2.SDL_KEYDOWN):
+                    offset = seek_keys.get(event.key.keysym.sym)
+                    if offset is not None:
+                        logger.debug("Seeking %d seconds.", offset)
+                        self.replay.seek(offset)
                 if not self.view_only:
                     if event.type == sdl2.SDL_KEYDOWN:
                         if event.key.keysym.sym == sdl2.SDLK_SPACE:
                             logger.debug("SPACE key pressed.")
-                            asyncio.async(self.client.split())
+                            self.client.enqueue(commands.SPLIT)
                         elif event.key.keysym.sym == sdl2.SDLK_w:
                             logger.debug("W key pressed.")
-                            asyncio.async(self.client.eject())
+                            self.client.enqueue(commands.EJECT)
                     elif event.type == sdl2.SDL_MOUSEMOTION:
                         self.mouse_x = event.motion.x
                         self.mouse_y = event.motion.y
@@ -633,20 +665,21 @@ class Visualizer:
                     elif (event.type == sdl2.SDL_MOUSEBUTTONDOWN and
                           event.button.button == sdl2.SDL_BUTTON_LEFT):
                         logger.debug("Mouse button pressed.")
-                        asyncio.async(self.client.spawn())
+                        self.client.enqueue(
+                            commands.spawn(self.client.nick))
 
             self.now = time.monotonic()
 
             if self.move is not None:
                 if self.move != self.last_move:
-                    asyncio.async(self.client.move(*self.move))
+                    self.client.set_move(*self.move)
                     self.last_move = self.move
                     self.last_move_send = self.now
                 elif self.now - self.last_move_send > 0.05:
                     self.move = self.tr_win2game_coords(self.mouse_x,
                                                         self.mouse_y)
                     if self.move:
-                        asyncio.async(self.client.move(*self.move))
+                        self.client.set_move(*self.move)
                         self.last_move = self.move
                         self.last_move_send = self.now
 
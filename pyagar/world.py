@@ -0,0 +1,174 @@
+"""
+``pyagar.world``
+================
+
+The state of the game.
+
+"""
+# pylint: disable=I0011,C0103
+import time
+
+from pyagar.messages import Status, PlayerCell, ScreenAndCamera
+from pyagar.messages import CameraPosition, MSGType, compiled
+from pyagar.messages import CELL_RECORD, SCREEN_RECORD, CAMERA_RECORD
+from pyagar.spatial import Grid
+
+#: Seconds between two searches of stale cells.
+EVICT_INTERVAL = 1
+
+_OPCODE = compiled("B")
+_COUNT = compiled("H")
+_ID = compiled("I")
+
+
+class World:
+    """
+    The state of the game built from the server messages.
+
+    A single ``World`` can be shared by several consumers: the ``Bus``
+    applies each message to it once and the consumers only read it.
+
+    ``owned`` contains the ids of all the cells of the player (more
+    than one after a split). With ``ttl`` the cells which have not been
+    updated for ``ttl`` seconds are evicted.
+
+    ``version`` is increased every time a message is applied or the
+    world is cleared.
+
+    ``index`` answers the spatial queries of :mod:`pyagar.spatial`: a
+    ``Grid`` kept up to date with every change or, in columnar mode,
+    the ``CellTable`` itself.
+
+    """
+    wants = (Status, PlayerCell, ScreenAndCamera, CameraPosition)
+
+    def __init__(self, columnar=False, ttl=None):
+        self.columnar = columnar
+        self.ttl = ttl
+        self.version = 0
+        self.clear()
+
+    def clear(self):
+        """Forget everything, as before receiving the first message."""
+        if self.columnar:
+            from pyagar.columnar import CellTable
+            self.cells = CellTable()
+            self.names = self.cells.names
+            self.index = self.cells
+        else:
+            self.cells = {}
+            self.names = {}
+            self.index = Grid()
+        self.seen = {}
+        self.owned = set()
+        self.screen = None
+        self.camera = None
+        self.last_evict = time.monotonic()
+        self.version += 1
+
+    @property
+    def alive(self):
+        """Whether the player has any cell."""
+        return bool(self.owned)
+
+    @property
+    def player_cells(self):
+        """The visible cells of the player."""
+        return [c for c in (self.cells.get(_id) for _id in self.owned)
+                if c is not None]
+
+    @property
+    def player(self):
+        """Returns the player main (bigger) cell. None if not exists."""
+        return max(self.player_cells, key=lambda c: c.size, default=None)
+
+    @property
+    def player_id(self):
+        """The id of the main cell of the player. None if not exists."""
+        p = self.player
+        return p.id if p is not None else None
+
+    def apply(self, data):
+        """Apply the changes of a message."""
+        if isinstance(data, self.wants):
+            self.version += 1
+        if isinstance(data, Status):
+            self.apply_status(data)
+        elif isinstance(data, PlayerCell):
+            self.owned.add(data.cell.id)
+        elif isinstance(data, ScreenAndCamera):
+            self.screen = data.screen
+            self.camera = data.camera
+        elif isinstance(data, CameraPosition):
+            self.camera = data.camera
+
+    def apply_status(self, data):
+        """Apply the changes of a ``Status`` message."""
+        now = time.monotonic()
+        gone = ([d.id for d in data.dissapears] +
+                [e.eatee for e in data.eat])
+
+        if self.columnar:
+            self.cells.apply(data, now)
+        else:
+            for cell in data.cells:
+                self.cells[cell.id] = cell
+                self.seen[cell.id] = now
+                self.index.update(cell)
+                if cell.name:
+                    self.names[cell.id] = cell.name
+
+        for _id in gone:
+            self.remove(_id)
+
+        if self.ttl is not None and now - self.last_evict > EVICT_INTERVAL:
+            self.evict(now - self.ttl)
+            self.last_evict = now
+
+    def remove(self, _id):
+        """Forget everything about the cell ``_id``."""
+        if not self.columnar:
+            self.cells.pop(_id, None)
+            self.names.pop(_id, None)
+            self.seen.pop(_id, None)
+            self.index.remove(_id)
+        self.owned.discard(_id)
+
+    def evict(self, before):
+        """Removes the cells not updated since ``before``."""
+        if self.columnar:
+            stale = self.cells.evict(before)
+        else:
+            stale = [_id for _id, t in self.seen.items() if t < before]
+        for _id in stale:
+            self.remove(_id)
+
+    def snapshot(self):
+        """
+        Returns the frames, as sent by the server, which rebuild this
+        state on an empty ``World``.
+
+        """
+        frames = []
+        if self.screen is not None:
+            frames.append(_OPCODE.pack(MSGType.ScreenAndCamera.value) +
+                          SCREEN_RECORD.pack(*self.screen))
+
+        status = [_OPCODE.pack(MSGType.Status.value), _COUNT.pack(0)]
+        for cell in self.cells.values():
+            r, g, b = (cell.color >> shift & 0xff for shift in (16, 8, 0))
+            status.append(CELL_RECORD.pack(cell.id, cell.x, cell.y, cell.size,
+                                           r, g, b, int(cell.is_virus)))
+            status.append((cell.name or "").encode('utf-16-le',
+                                                   'surrogatepass') + b"\0\0")
+        status.append(_ID.pack(0) + _ID.pack(0))
+        frames.append(b"".join(status))
+
+        for _id in self.owned:
+            frames.append(_OPCODE.pack(MSGType.PlayerCell.value) +
+                          _ID.pack(_id))
+
+        if self.camera is not None:
+            frames.append(_OPCODE.pack(MSGType.CameraPosition.value) +
+                          CAMERA_RECORD.pack(*self.camera))
+        return frames
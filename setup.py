@@ -31,6 +31,11 @@ setup(name='pyagar',
           'websockets==2.4',
           'tabulate==0.7.5'
       ],
+      extras_require={
+          'columnar': ['numpy==1.13.3'],
+          'analysis': ['numpy==1.13.3'],
+          'dataset': ['numpy==1.13.3']
+      },
       entry_points={
           'console_scripts':
               ['pyagar=pyagar.cmdline:pyagar']
@@ -0,0 +1,72 @@
+import asyncio
+import struct
+
+import pytest
+
+if not hasattr(asyncio, 'coroutine'):
+    pytest.skip("the coroutines of the package need asyncio.coroutine",
+                allow_module_level=True)
+
+from test_messages import status_frame
+
+np = pytest.importorskip("numpy")
+analysis = pytest.importorskip("pyagar.analysis")
+
+SCREEN = struct.pack("<Bdddd", 64, 0, 0, 100, 100)
+
+
+def leaderboard(*ids):
+    frame = struct.pack("<BI", 49, len(ids))
+    for _id in ids:
+        frame += struct.pack("<I", _id) + b"\0\0"
+    return frame
+
+
+FRAMES = [
+    (10.0, SCREEN),
+    (10.0, struct.pack("<BI", 32, 7)),
+    (10.0, struct.pack("<BI", 32, 8)),
+    (11.0, status_frame(cells=[(7, 10, 10, 20, (1, 2, 3), 0, ""),
+                               (8, 40, 10, 10, (1, 2, 3), 0, ""),
+                               (9, 50, 50, 5, (1, 2, 3), 0, "prey")])),
+    (12.0, status_frame(eats=[(7, 9)])),
+    (12.5, leaderboard(3, 7)),
+    (13.0, status_frame(eats=[(1, 7), (1, 8)])),
+]
+
+
+def test_metrics():
+    arrays = analysis.metrics(FRAMES)
+
+    assert arrays['time'].tolist() == [1, 2, 3]
+    assert arrays['mass'].tolist() == [5, 5, 0]
+    assert arrays['x'][0] == 16
+    assert arrays['y'][0] == 10
+    assert np.isnan(arrays['x'][2])
+    assert arrays['alive'].tolist() == [True, True, False]
+    assert arrays['kills'].tolist() == [2]
+    assert arrays['deaths'].tolist() == [3]
+    assert arrays['leaderboard_rank'].tolist() == [2]
+    assert arrays['heatmap'].sum() == 2
+
+
+def test_summary():
+    summary = analysis.summary(analysis.metrics(FRAMES))
+
+    assert summary == {'duration': 2, 'alive': 2, 'max_mass': 5,
+                       'kills': 1, 'deaths': 1, 'best_rank': 2}
+
+
+def test_summary_of_nothing():
+    summary = analysis.summary(analysis.metrics([]))
+
+    assert summary['duration'] == summary['max_mass'] == 0
+
+
+def test_outputs_must_not_collide(tmpdir):
+    files = [str(tmpdir.join(d, "game.rec")) for d in ("a", "b")]
+
+    with pytest.raises(ValueError):
+        list(analysis.analyze_all(files, str(tmpdir.join("out"))))
+    with pytest.raises(ValueError):
+        list(analysis.analyze_all(files[:1] * 2, str(tmpdir.join("out"))))
@@ -0,0 +1,121 @@
+import asyncio
+import struct
+
+import pytest
+
+if not hasattr(asyncio, 'coroutine'):
+    pytest.skip("the coroutines of the package need asyncio.coroutine",
+                allow_module_level=True)
+
+from pyagar import commands
+from pyagar.bus import Bus, Raw, Sent
+from pyagar.messages import MSG, Decoders, Status, LazyStatus, PlayerCell
+from pyagar.messages import ScreenAndCamera
+from pyagar.world import World
+
+from test_messages import status_frame
+
+SCREEN = struct.pack("<Bdddd", 64, 0, 0, 100, 50)
+PLAYER = struct.pack("<BI", 32, 7)
+STATUS = status_frame(cells=[(7, 1, 2, 30, (1, 2, 3), 0, "bob")])
+
+
+class Source:
+    def __init__(self, **kwargs):
+        self.messages = asyncio.Queue()
+        self.decoders = Decoders(**kwargs)
+        self.raw = False
+        self.outgoing = False
+
+    def put(self, frame):
+        self.messages.put_nowait(MSG(frame, decoders=self.decoders))
+
+
+class Log:
+    """A queue writing down what it is given, and when."""
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+
+    def put_nowait(self, item):
+        self.log.append((self.name, item))
+
+
+class LoggedWorld:
+    wants = (Status, PlayerCell)
+
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+
+    def apply(self, data):
+        self.log.append((self.name, data))
+
+
+class Consumer:
+    def __init__(self, wants, world=None):
+        self.wants = wants
+        self.world = world
+        self.messages = asyncio.Queue()
+
+    def received(self):
+        items = []
+        while not self.messages.empty():
+            items.append(self.messages.get_nowait())
+        return items
+
+
+def deliver(bus):
+    loop = asyncio.get_event_loop()
+    task = loop.create_task(bus.run())
+    loop.run_until_complete(asyncio.wait_for(bus.src.messages.join(), 1))
+    task.cancel()
+
+
+def test_messages_are_routed_by_type():
+    src = Source(lazy=True)
+    bus = Bus(src)
+    screen, status = Consumer((ScreenAndCamera,)), Consumer((Status,))
+    raw, sent = Consumer((Raw,)), Consumer((Sent, PlayerCell))
+    for consumer in (screen, status, raw, sent):
+        bus.subscribe(consumer)
+
+    for frame in (SCREEN, STATUS, PLAYER):
+        src.put(frame)
+    src.messages.put_nowait(Sent(commands.SPLIT))
+    deliver(bus)
+
+    assert [type(m) for m in screen.received()] == [ScreenAndCamera]
+    assert [type(m) for m in status.received()] == [LazyStatus]
+    assert [bytes(f) for f in raw.received()] == [SCREEN, STATUS, PLAYER]
+    assert [type(m) for m in sent.received()] == [PlayerCell, Sent]
+    assert src.raw and src.outgoing
+
+
+def test_decoders_want_what_is_subscribed():
+    src = Source()
+    bus = Bus(src)
+    bus.subscribe(Consumer((ScreenAndCamera,), world=World()))
+
+    assert set(src.decoders.wanted) == {ScreenAndCamera} | set(World.wants)
+    assert not src.raw and not src.outgoing
+
+    bus.subscribe(Consumer(None))
+    assert src.decoders.wanted is None
+
+
+def test_each_world_is_applied_once_before_the_delivery():
+    log = []
+    src = Source()
+    bus = Bus(src)
+    first, second = LoggedWorld(log, "first"), LoggedWorld(log, "second")
+    for name, world in (("a", first), ("b", first), ("c", second)):
+        consumer = Consumer((PlayerCell,), world=world)
+        consumer.messages = Log(log, name)
+        bus.subscribe(consumer)
+
+    src.put(PLAYER)
+    deliver(bus)
+
+    assert [name for name, _ in log] == ["first", "second", "a", "b", "c"]
+    assert len(set(id(data) for _, data in log)) == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+if not hasattr(asyncio, 'coroutine'):
+    pytest.skip("the coroutines of the package need asyncio.coroutine",
+                allow_module_level=True)
+
+from pyagar import commands
+from pyagar.client import Client, MAX_COMMANDS
+
+
+class WebSocket:
+    def __init__(self, fail=()):
+        self.sent = []
+        self.fail = fail
+
+    @asyncio.coroutine
+    def send(self, payload):
+        if payload in self.fail:
+            raise ConnectionError("closed")
+        self.sent.append(payload)
+
+
+def run_writer(client):
+    loop = asyncio.get_event_loop()
+    client.connected.set()
+    task = loop.create_task(client.write())
+    loop.run_until_complete(asyncio.sleep(0.01))
+    task.cancel()
+
+
+def test_moves_keep_their_place_in_order():
+    client = Client("me")
+    client.enqueue(commands.spawn("me"))
+    client.set_move(1, 1)
+    client.set_move(2, 2)
+    client.enqueue(commands.SPLIT)
+    client.set_move(3, 3)
+
+    assert list(client.commands) == [commands.spawn("me"), commands.move(2, 2),
+                                     commands.SPLIT, commands.move(3, 3)]
+    assert client.coalesced == 1
+
+
+def test_oldest_commands_are_dropped():
+    client = Client("me")
+    for _ in range(MAX_COMMANDS + 2):
+        client.enqueue(commands.EJECT)
+
+    assert len(client.commands) == MAX_COMMANDS
+    assert client.dropped == 2
+
+
+def test_writer_survives_send_errors():
+    client = Client("me")
+    client.ws = WebSocket(fail=[commands.SPLIT])
+    client.set_move(1, 1)
+    client.enqueue(commands.SPLIT)
+    client.enqueue(commands.EJECT)
+
+    run_writer(client)
+
+    assert client.ws.sent == [commands.move(1, 1), commands.EJECT]
+    assert (client.sent, client.dropped) == (2, 1)
+    assert not client.commands
@@ -0,0 +1,74 @@
+import pytest
+
+from pyagar import messages
+
+from test_messages import status_frame
+
+np = pytest.importorskip("numpy")
+columnar = pytest.importorskip("pyagar.columnar")
+
+CELLS = [(7, -10, 20, 35, (0x12, 0x34, 0x56), 0, "bob"),
+         (8, 100, 200, 100, (0, 255, 0), 1 | 4, ""),
+         (3, 1, 2, 3, (1, 2, 3), 0, "ñandú")]
+
+
+def decode(frame, **kwargs):
+    return messages.MSG(frame,
+                        decoders=messages.Decoders(**kwargs)).data
+
+
+def astuples(cells):
+    return [c.astuple() for c in cells]
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_columnar_status_matches_object_decode(lazy):
+    frame = status_frame(eats=[(1, 2)], cells=CELLS, dissapears=[4])
+
+    expected = decode(frame)
+    data = decode(frame, columnar=True, lazy=lazy)
+
+    assert isinstance(data, columnar.ColumnarStatus)
+    assert astuples(data.cells) == astuples(expected.cells)
+    assert data.table['id'].tolist() == [7, 8, 3]
+    assert data.names == {7: "bob", 3: "ñandú"}
+    assert data.eat == expected.eat
+    assert data.dissapears == expected.dissapears
+
+
+def test_cell_table_matches_dict():
+    table = columnar.CellTable()
+    table.apply(decode(status_frame(cells=CELLS), columnar=True))
+    table.apply(decode(status_frame(
+        eats=[(8, 7)],
+        cells=[(5, 0, 0, 10, (1, 1, 1), 0, ""),
+               (8, 101, 201, 110, (0, 255, 0), 1, "")]), columnar=True))
+
+    expected = {c.id: c for c in decode(status_frame(
+        cells=CELLS[1:] + [(5, 0, 0, 10, (1, 1, 1), 0, ""),
+                           (8, 101, 201, 110, (0, 255, 0), 1, "")])).cells}
+    assert sorted(table) == [3, 5, 8]
+    assert len(table) == 3
+    for _id, cell in expected.items():
+        assert _id in table
+        assert table[_id].astuple() == cell.astuple()
+    assert 7 not in table
+    assert table.get(7) is None
+    assert table.names == {3: "ñandú"}
+
+    del table[5]
+    assert sorted(table) == [3, 8]
+    with pytest.raises(KeyError):
+        del table[5]
+
+
+def test_cell_selection_queries():
+    table = columnar.CellTable()
+    table.apply(decode(status_frame(cells=CELLS), columnar=True))
+
+    viruses = table.select(virus=True)
+    assert [c.id for c in viruses] == [8]
+    assert table.select(exclude={7}, virus=False).nearest(0, 0).id == 3
+    assert [c.id for c in table.select().drawing_order()] == [3, 7, 8]
+    assert [c.id for c in table.knearest(0, 0, k=2)] == [3, 7]
+    assert [c.id for c in table.within_rect(-20, 0, 10, 30)] == [3, 7]
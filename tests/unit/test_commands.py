@@ -0,0 +1,13 @@
+from pyagar import commands
+from pyagar.commands import CommandType
+
+
+def test_decode_move():
+    assert commands.decode(commands.move(10, -20)) == (CommandType.Move,
+                                                      (10, -20))
+
+
+def test_decode_other_commands():
+    assert commands.decode(commands.SPLIT) == (CommandType.Split, None)
+    assert commands.decode(commands.spawn("me")) == (CommandType.Spawn, None)
+    assert commands.decode(b"\x63") == (None, None)
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+if not hasattr(asyncio, 'coroutine'):
+    pytest.skip("the coroutines of the package need asyncio.coroutine",
+                allow_module_level=True)
+
+from pyagar.cmdline import build_bot
+from pyagar.control import Controller, Movement
+from pyagar.world import World
+
+from test_world import player_cell
+
+
+class Client:
+    columnar = False
+
+    def __init__(self):
+        self.sent = []
+
+    @asyncio.coroutine
+    def spawn(self):
+        self.sent.append("spawn")
+
+    @asyncio.coroutine
+    def move(self, x, y):
+        self.sent.append(("move", x, y))
+
+
+class UserBot(Controller):
+    """A bot written before the ``World``."""
+    def __init__(self, client):
+        super().__init__(client)
+        self.alive = False
+
+    def get_movement(self):
+        return Movement(0, 0)
+
+
+def test_build_bot_with_old_constructor():
+    world = World()
+    bot = build_bot(UserBot, Client(), world, rate=5)
+
+    assert bot.world is world
+    assert bot.rate == 5
+
+
+def test_bot_attributes_are_assignable():
+    world = World()
+    bot = build_bot(UserBot, Client(), world)
+    world.apply(player_cell(7))
+    assert bot.alive
+
+    bot.alive = False
+    assert not bot.alive
+    del bot.alive
+    assert bot.alive
+
+    bot.screen = "board"
+    assert bot.screen == "board"
+    assert bot.cells is world.cells
+
+
+def run_for(bot, seconds):
+    loop = asyncio.get_event_loop()
+    task = loop.create_task(bot.run())
+    loop.run_until_complete(asyncio.sleep(seconds))
+    return task
+
+
+def test_pending_messages_get_a_single_decision():
+    world = World()
+    world.apply(player_cell(7))
+    bot = build_bot(UserBot, Client(), world)
+    for _ in range(5):
+        bot.messages.put_nowait(object())
+
+    task = run_for(bot, 0.01)
+    task.cancel()
+
+    assert bot.client.sent == [("move", 0, 0)]
+    assert (bot.ticks, bot.coalesced) == (1, 4)
+
+
+def test_rate_limits_the_decisions():
+    loop = asyncio.get_event_loop()
+    bot = build_bot(UserBot, Client(), World(), rate=10)
+    bot.messages.put_nowait(object())
+    task = run_for(bot, 0.01)
+
+    bot.messages.put_nowait(object())
+    loop.run_until_complete(asyncio.sleep(0.02))
+    assert bot.ticks == 1
+
+    loop.run_until_complete(asyncio.sleep(0.15))
+    task.cancel()
+    assert bot.ticks == 2
+    assert bot.client.sent == ["spawn", ("move", 0, 0)] * 2
@@ -0,0 +1,60 @@
+import asyncio
+import struct
+
+import pytest
+
+if not hasattr(asyncio, 'coroutine'):
+    pytest.skip("the coroutines of the package need asyncio.coroutine",
+                allow_module_level=True)
+
+from pyagar import commands
+from pyagar.cmdline import pyagar
+from pyagar.recording import save_records, pack_frame, pack_keyframe
+from pyagar.recording import pack_command
+
+from test_messages import status_frame
+
+np = pytest.importorskip("numpy")
+dataset = pytest.importorskip("pyagar.dataset")
+
+SCREEN = struct.pack("<Bdddd", 64, 0, 0, 100, 100)
+STATUS = status_frame(cells=[(7, 10, 20, 20, (1, 2, 3), 0, ""),
+                             (9, 13, 24, 30, (1, 2, 3), 1, "")])
+
+
+def game(tmpdir, name):
+    filename = str(tmpdir.join(name))
+    save_records(filename, [
+        pack_keyframe(1.0, [SCREEN, struct.pack("<BI", 32, 7)]),
+        pack_frame(2.0, STATUS),
+        pack_command(2.1, commands.move(50, 60)),
+        pack_command(2.2, commands.SPLIT),
+        pack_frame(3.0, STATUS)])
+    return filename
+
+
+def test_export_rows(tmpdir):
+    output = str(tmpdir.join("dataset"))
+    exported = list(dataset.export_all([game(tmpdir, "a.rec")], output))
+
+    assert exported == [(str(tmpdir.join("a.rec")), 2)]
+    rows, = dataset.load(output)
+    assert rows['alive'].all()
+    assert rows['mass'].tolist() == [4, 4]
+    assert rows['neighbors'][0, 0].tolist() == [3, 4, 30, 1]
+    assert rows['move'].tolist() == [True, False]
+    assert (rows['move_x'][0], rows['move_y'][0]) == (50, 60)
+    assert rows['split'].tolist() == [True, False]
+
+
+def test_export_command_writes_the_last_chunk(tmpdir):
+    output = str(tmpdir.join("dataset"))
+    files = [game(tmpdir, "a.rec"), game(tmpdir, "b.rec")]
+
+    with pytest.raises(SystemExit) as exc:
+        pyagar(["export"] + files + ["-o", output, "--chunk-rows", "1000"])
+
+    assert exc.value.code == 0
+    chunks = dataset.load(output)
+    assert sum(len(chunk) for chunk in chunks) == 4
+    assert np.concatenate(chunks)['game'].tolist() == [0, 0, 1, 1]
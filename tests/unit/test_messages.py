@@ -0,0 +1,153 @@
+import struct
+
+from pyagar import messages
+
+
+def status_frame(eats=(), cells=(), dissapears=()):
+    """Builds a raw ``Status`` frame."""
+    frame = struct.pack("<BH", 16, len(eats))
+    for eater, eatee in eats:
+        frame += struct.pack("<II", eater, eatee)
+    for _id, x, y, size, rgb, flags, name in cells:
+        frame += struct.pack("<IiihBBBB", _id, x, y, size,
+                             *(rgb + (flags,)))
+        frame += b"\x00" * {2: 4, 4: 8, 8: 16}.get(flags & 14, 0)
+        frame += name.encode("utf-16-le", "surrogatepass") + b"\x00\x00"
+    frame += struct.pack("<I", 0)
+    frame += struct.pack("<I", len(dissapears))
+    for _id in dissapears:
+        frame += struct.pack("<I", _id)
+    return frame
+
+
+def test_status_parse():
+    frame = status_frame(
+        eats=[(1, 2)],
+        cells=[(7, -10, 20, 35, (0x12, 0x34, 0x56), 0, "bob"),
+               (8, 100, 200, 100, (0, 255, 0), 1 | 4, ""),
+               (9, 1, 2, 3, (1, 2, 3), 0, "ñandú")],
+        dissapears=[3, 4])
+
+    data = messages.MSG(frame).data
+
+    assert isinstance(data, messages.Status)
+    assert data.eat == [messages.Eat(eater=1, eatee=2)]
+    assert data.cells == [
+        messages.Cell(7, -10, 20, 35, 0x123456, False, "bob"),
+        messages.Cell(8, 100, 200, 100, 0x00ff00, True, None),
+        messages.Cell(9, 1, 2, 3, 0x010203, False, "ñandú")]
+    assert data.dissapears == [messages.Dissapear(3),
+                               messages.Dissapear(4)]
+
+
+def test_status_parse_empty():
+    data = messages.MSG(status_frame()).data
+
+    assert data.eat == []
+    assert data.cells == []
+    assert data.dissapears == []
+
+
+def test_leaderboard_parse():
+    frame = struct.pack("<BI", 49, 2)
+    frame += struct.pack("<I", 5) + "first".encode("utf-16-le") + b"\0\0"
+    frame += struct.pack("<I", 6) + "second".encode("utf-16-le") + b"\0\0"
+
+    data = messages.MSG(frame).data
+
+    assert data.players == [messages.Player(5, "first"),
+                            messages.Player(6, "second")]
+
+
+def test_screen_and_camera_parse():
+    frame = struct.pack("<Bdddd", 64, 0, 0, 100, 50)
+
+    data = messages.MSG(frame).data
+
+    assert data.screen == messages.Screen(0, 0, 100, 50)
+    assert data.camera == messages.Camera(50, 25, 1)
+
+
+def test_unknown_message():
+    msg = messages.MSG(struct.pack("<B", 99))
+
+    assert msg.data is None
+    assert not msg.skipped
+
+
+def test_decoders_want():
+    decoders = messages.Decoders()
+    decoders.want((messages.ScreenAndCamera,))
+
+    skipped = messages.MSG(struct.pack("<BI", 49, 0), decoders=decoders)
+    wanted = messages.MSG(struct.pack("<Bdddd", 64, 0, 0, 10, 10),
+                          decoders=decoders)
+
+    assert skipped.data is None
+    assert skipped.skipped
+    assert isinstance(wanted.data, messages.ScreenAndCamera)
+
+
+def test_decoders_register():
+    class Custom(messages.BaseMSG):
+        def parse(self):
+            self.value = self.getUint8()
+
+    decoders = messages.Decoders()
+    decoders.register(99, Custom)
+
+    assert messages.MSG(struct.pack("<BB", 99, 7),
+                        decoders=decoders).data.value == 7
+
+
+def test_string_requires_terminator():
+    frame = struct.pack("<BI", 49, 1) + struct.pack("<I", 5) + b"a\x00"
+
+    try:
+        messages.MSG(frame)
+    except struct.error:
+        assert True
+    else:
+        assert False, "Unterminated string accepted."
+
+
+def test_message_pickle():
+    import pickle
+
+    frame = status_frame(cells=[(7, 1, 2, 3, (1, 2, 3), 0, "bob")])
+    data = pickle.loads(pickle.dumps(messages.MSG(frame).data))
+
+    assert data.cells == [messages.Cell(7, 1, 2, 3, 0x010203, False, "bob")]
+    assert isinstance(data.buf, memoryview)
+
+
+def test_lazy_status():
+    frame = status_frame(eats=[(1, 2)],
+                         cells=[(7, 1, 2, 3, (1, 2, 3), 0, "bob")],
+                         dissapears=[3])
+    decoders = messages.Decoders()
+    decoders.register(messages.MSGType.Status, messages.LazyStatus)
+    data = messages.MSG(frame, decoders=decoders).data
+
+    assert data.eat == [messages.Eat(eater=1, eatee=2)]
+    assert 'cells' not in data.__dict__
+    assert data.dissapears == [messages.Dissapear(3)]
+    assert data.cells == [messages.Cell(7, 1, 2, 3, 0x010203, False, "bob")]
+
+
+def test_names_are_interned():
+    frame = status_frame(cells=[(7, 1, 2, 3, (1, 2, 3), 0, "bob"),
+                                (8, 1, 2, 3, (1, 2, 3), 0, "bob")])
+    first, second = messages.MSG(frame).data.cells
+
+    assert first.name is second.name
+    assert messages.MSG(frame).data.cells[0].name is first.name
+
+
+def test_name_table_is_bounded():
+    names = messages.NameTable(size=2)
+    for name in ("a", "b", "c"):
+        names.intern(name.encode("utf-16-le"))
+
+    assert len(names) == 2
+    assert list(names.names.values()) == ["b", "c"]
@@ -0,0 +1,333 @@
+import asyncio
+import pickle
+import struct
+
+import pytest
+
+if not hasattr(asyncio, 'coroutine'):
+    pytest.skip("the coroutines of the package need asyncio.coroutine",
+                allow_module_level=True)
+
+from pyagar import commands, messages, utils
+from pyagar import recording
+from pyagar.bus import Bus
+from pyagar.control import Controller, Movement
+from pyagar.queues import BLOCK
+from pyagar.recording import KEYFRAME, OUTGOING, MAGIC, INDEX_RECORD
+from pyagar.world import World
+
+from test_messages import status_frame
+
+SCREEN = struct.pack("<Bdddd", 64, 0, 0, 100, 50)
+STATUS = status_frame(cells=[(7, 1, 2, 30, (1, 2, 3), 0, "bob")])
+
+
+def save(tmpdir, records, name="game.rec"):
+    filename = str(tmpdir.join(name))
+    recording.save_records(filename, records)
+    return filename
+
+
+def test_records_round_trip(tmpdir):
+    filename = save(tmpdir, [
+        recording.pack_frame(1.0, SCREEN),
+        recording.pack_keyframe(2.0, [SCREEN, STATUS]),
+        recording.pack_command(2.5, commands.SPLIT),
+        recording.pack_frame(3.0, STATUS)])
+
+    with open(filename, 'rb') as fd:
+        recording.check_magic(fd)
+        records = list(recording.read_records(fd))
+    assert [(t, k) for t, k, _ in records] == [(1.0, 0), (2.0, KEYFRAME),
+                                               (2.5, OUTGOING), (3.0, 0)]
+    assert recording.split_keyframe(records[1][2]) == [SCREEN, STATUS]
+    assert records[2][2] == commands.SPLIT
+
+    with recording.Recording(filename) as rec:
+        assert [(t, bytes(f)) for t, f in rec] == [(1.0, SCREEN),
+                                                   (3.0, STATUS)]
+        assert ([bytes(p) for _, _, _, p in rec.records()] ==
+                [p for _, _, p in records])
+
+
+def test_truncated_record_is_ignored(tmpdir):
+    record = recording.pack_frame(1.0, SCREEN)
+    filename = save(tmpdir, [record, record[:-1]])
+
+    with recording.Recording(filename) as rec:
+        assert len(list(rec)) == 1
+
+
+def test_index_is_rebuilt_when_missing(tmpdir):
+    first = recording.pack_frame(1.0, SCREEN)
+    filename = save(tmpdir, [first,
+                             recording.pack_keyframe(2.0, [SCREEN]),
+                             recording.pack_frame(3.0, STATUS),
+                             recording.pack_keyframe(4.0, [SCREEN])])
+    index = recording.build_index(filename)
+
+    offset = len(MAGIC) + len(first)
+    assert index[0] == (2.0, offset)
+    assert [t for t, _ in index] == [2.0, 4.0]
+    assert recording.load_index(filename) == index
+
+    with open(recording.index_filename(filename), 'wb') as fd:
+        fd.write(INDEX_RECORD.pack(2.0, offset) + b"\x00")
+    assert recording.load_index(filename) == [(2.0, offset)]
+
+
+def test_convert_old_recording(tmpdir):
+    old = str(tmpdir.join("old.rec"))
+    with open(old, 'wb') as fd:
+        for timestamp, frame in ((1.0, SCREEN), (2.0, STATUS)):
+            pickle.dump((timestamp, messages.MSG(frame)), fd)
+
+    new = str(tmpdir.join("new.rec"))
+    assert recording.convert(old, new) == 2
+    with recording.Recording(new) as rec:
+        assert [(t, bytes(f)) for t, f in rec] == [(1.0, SCREEN),
+                                                   (2.0, STATUS)]
+
+
+def test_seek_restores_the_keyframe_before_the_target():
+    replay = recording.GameReplay("game.rec")
+    replay.index = [(10.0, 100), (20.0, 200)]
+    replay.position = 15.0
+
+    replay.target = 17.0
+    assert replay.restart() is None
+
+    replay.target = 25.0
+    assert replay.restart() == 200
+    assert replay.position is None
+
+    replay.position, replay.target = 15.0, 5.0
+    assert replay.restart() == len(MAGIC)
+
+
+def test_old_names_still_importable():
+    assert utils.GameplaySaver is recording.GameplaySaver
+    assert isinstance(recording.GameReplay("game.rec"), utils.GameReplay)
+
+
+def test_keyframe_follows_the_frames_already_applied(tmpdir):
+    world = World()
+    world.apply(messages.MSG(SCREEN).data)
+    filename = str(tmpdir.join("saved.rec"))
+    saver = recording.GameplaySaver(filename, world=world,
+                                    keyframe_interval=0,
+                                    fsync_interval=None)
+    for frame in (SCREEN, STATUS, STATUS):
+        saver.messages.put_nowait(memoryview(frame))
+
+    loop = asyncio.get_event_loop()
+    task = loop.create_task(saver.run())
+    loop.run_until_complete(asyncio.sleep(0.01))
+    task.cancel()
+    loop.run_until_complete(asyncio.wait([task]))
+
+    with recording.Recording(filename) as rec:
+        kinds = [kind for _, _, kind, _ in rec.records()]
+    assert kinds == [0, 0, 0, KEYFRAME]
+    assert recording.load_index(filename) == recording.build_index(filename)
+
+
+def test_writer_batches_and_writes_everything_on_close(tmpdir):
+    filename = str(tmpdir.join("written.rec"))
+    writer = recording.RecordingWriter(filename, batch_size=64,
+                                       fsync_interval=None)
+    records = [recording.pack_frame(float(i), STATUS) for i in range(50)]
+    for record in records:
+        assert writer.write(record)
+    writer.write(b"", INDEX_RECORD.pack(1.0, 2))
+    writer.start()
+    writer.close()
+
+    with open(filename, 'rb') as fd:
+        assert fd.read() == b"".join(records)
+    assert recording.load_index(filename) == [(1.0, 2)]
+    assert 1 < writer.batches < len(records)
+    assert writer.written == len(records) + 1
+    writer.close()
+
+
+def test_writer_drops_when_behind_or_failed(tmpdir):
+    writer = recording.RecordingWriter(str(tmpdir.join("full.rec")),
+                                       max_pending=2)
+    assert writer.write(SCREEN)
+    assert writer.write(SCREEN)
+    assert not writer.write(SCREEN)
+    assert writer.dropped == 1
+
+    failed = recording.RecordingWriter(str(tmpdir.join("no", "dir.rec")))
+    failed.start()
+    failed.join()
+    assert isinstance(failed.error, OSError)
+    assert not failed.write(SCREEN)
+    failed.close()
+
+
+def test_leading_keyframe_is_the_initial_state(tmpdir):
+    filename = save(tmpdir, [recording.pack_keyframe(1.0, [SCREEN]),
+                             recording.pack_frame(2.0, STATUS),
+                             recording.pack_keyframe(3.0, [SCREEN])])
+
+    expected = [(1.0, SCREEN), (2.0, STATUS)]
+    with recording.Recording(filename) as rec:
+        assert [(t, bytes(f)) for t, f in rec] == expected
+    with open(filename, 'rb') as fd:
+        assert list(recording.read_frames(fd)) == expected
+
+
+def test_flight_recorder_dumps_on_death(tmpdir, monkeypatch):
+    world = World()
+    recorder = recording.FlightRecorder(str(tmpdir), world=world)
+    dumps = []
+    monkeypatch.setattr(recorder, 'dump', dumps.append)
+
+    for frame in (struct.pack("<BI", 32, 7), STATUS,
+                  status_frame(eats=[(9, 7)])):
+        data = messages.MSG(frame).data
+        world.apply(data)
+        recorder.track(data)
+
+    assert dumps == ["death"]
+
+
+def test_prefetcher_is_done_when_stopped(tmpdir):
+    filename = save(tmpdir, [recording.pack_frame(float(i), STATUS)
+                             for i in range(10)])
+
+    with recording.Recording(filename) as rec:
+        prefetcher = recording.Prefetcher(rec, messages.Decoders(),
+                                          lookahead=2)
+        prefetcher.start()
+        timestamp, keyframe, payload, msg = prefetcher.get()
+        assert (timestamp, keyframe) == (0.0, False)
+        assert msg.data.cells[0].name == "bob"
+        prefetcher.stop()
+        assert not prefetcher.is_alive()
+
+
+def camera(x):
+    return struct.pack("<Bfff", 17, x, 0, 1)
+
+
+def leaderboard(_id):
+    return struct.pack("<BII", 49, 1, _id) + b"\0\0"
+
+
+def fake_clock(monkeypatch, replay, stalls=()):
+    """
+    Makes ``replay`` wait on a clock that only moves while it waits, and
+    ``stalls`` seconds more each time. Returns the delays waited.
+
+    """
+    now = [100.0]
+    stalls = list(stalls)
+    delays = []
+
+    @asyncio.coroutine
+    def wait(delay):
+        delays.append(delay)
+        now[0] += max(delay, 0) + (stalls.pop(0) if stalls else 0)
+
+    monkeypatch.setattr(asyncio.get_event_loop(), 'time', lambda: now[0])
+    monkeypatch.setattr(replay, 'wait', wait)
+    return delays
+
+
+def schedule(replay, *timestamps):
+    loop = asyncio.get_event_loop()
+    return [loop.run_until_complete(replay.schedule(t)) for t in timestamps]
+
+
+def test_deadlines_do_not_add_up_the_delays(monkeypatch):
+    replay = recording.GameReplay("game.rec", speed=2)
+    delays = fake_clock(monkeypatch, replay, stalls=[0.01] * 3)
+
+    assert schedule(replay, 10, 11, 12) == [False] * 3
+    assert [round(d, 6) for d in delays] == [0, 0.49, 0.49]
+    assert round(replay.lag, 6) == round(replay.max_lag, 6) == 0.01
+
+
+def test_lag_is_measured_against_the_deadlines(monkeypatch):
+    replay = recording.GameReplay("game.rec")
+    fake_clock(monkeypatch, replay, stalls=[0, 0.5, 0])
+
+    assert schedule(replay, 0, 1, 2) == [False, True, False]
+    assert replay.lag == 0
+    assert replay.max_lag == 0.5
+
+    replay.speed = float('inf')
+    assert schedule(replay, 1000) == [False]
+
+
+def test_late_replay_queues_only_the_last_superseded_frames(tmpdir,
+                                                           monkeypatch):
+    frames = [(0.0, STATUS), (1.0, camera(1)), (1.1, leaderboard(1)),
+              (1.2, camera(2)), (1.3, leaderboard(2)), (3.0, STATUS)]
+    filename = save(tmpdir, [recording.pack_frame(t, f) for t, f in frames])
+    replay = recording.GameReplay(filename)
+    fake_clock(monkeypatch, replay, stalls=[0, 1])
+
+    queued = []
+
+    @asyncio.coroutine
+    def consume():
+        while True:
+            msg = yield from replay.messages.get()
+            queued.append(bytes(msg.buf))
+            replay.messages.task_done()
+
+    loop = asyncio.get_event_loop()
+    consumer = loop.create_task(consume())
+    loop.run_until_complete(replay.run())
+    consumer.cancel()
+
+    assert queued[0] == queued[-1] == STATUS
+    assert sorted(queued[1:-1]) == sorted([camera(2), leaderboard(2)])
+    assert replay.coalesced == 2
+    assert replay.max_lag == 1
+    assert replay.lag == 0
+
+
+class CountingWorld(World):
+    def __init__(self):
+        super().__init__()
+        self.applied = 0
+
+    def apply(self, data):
+        self.applied += 1
+        super().apply(data)
+
+
+class Still(Controller):
+    def get_movement(self):
+        return Movement(0, 0)
+
+
+def test_replay_feeds_a_bot_at_infinite_speed(tmpdir):
+    statuses = [status_frame(cells=[(7, x, 2, 30, (1, 2, 3), 0, "bob")])
+                for x in range(50)]
+    frames = [SCREEN, struct.pack("<BI", 32, 7)] + statuses
+    filename = save(tmpdir, [recording.pack_frame(float(t), f)
+                             for t, f in enumerate(frames)])
+
+    world = CountingWorld()
+    replay = recording.GameReplay(filename, world=world, speed=float('inf'))
+    bot = Still(recording.OfflineClient("me"), world=world)
+    bot.messages.overflow = BLOCK
+    bus = Bus(replay)
+    bus.subscribe(bot)
+
+    loop = asyncio.get_event_loop()
+    tasks = [loop.create_task(bot.run()), loop.create_task(bus.run())]
+    loop.run_until_complete(asyncio.wait_for(replay.run(), 5))
+    for task in tasks:
+        task.cancel()
+
+    assert world.applied == len(frames)
+    assert world.cells[7].x == 49
+    assert 0 < bot.ticks <= len(frames)
+    assert bot.client.sent >= bot.ticks
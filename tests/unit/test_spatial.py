@@ -0,0 +1,30 @@
+from pyagar.messages import Cell
+from pyagar.spatial import Grid
+
+
+def cell(_id, x, y, size=10, is_virus=False):
+    return Cell(_id, x, y, size, 0, is_virus, None)
+
+
+def test_grid_knearest():
+    grid = Grid(step=10)
+    for c in (cell(1, 0, 0), cell(2, 100, 0), cell(3, 35, 5),
+              cell(4, 3, 3, is_virus=True), cell(5, -40, 0, size=50)):
+        grid.update(c)
+
+    assert [c.id for c in grid.knearest(1, 1, 2)] == [1, 4]
+    assert [c.id for c in grid.knearest(1, 1, 3, exclude={1},
+                                        virus=False)] == [3, 5, 2]
+    assert [c.id for c in grid.knearest(1, 1, bigger_than=20)] == [5]
+
+
+def test_grid_update_and_remove():
+    grid = Grid(step=10)
+    grid.update(cell(1, 0, 0))
+    grid.update(cell(1, 500, 500))
+    grid.update(cell(2, 10, 10))
+    grid.remove(2)
+
+    assert len(grid) == 1
+    assert grid.within_rect(-5, -5, 50, 50) == []
+    assert [c.id for c in grid.within_radius(490, 490, 20)] == [1]
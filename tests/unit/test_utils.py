@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+if not hasattr(asyncio, 'coroutine'):
+    pytest.skip("the coroutines of the package need asyncio.coroutine",
+                allow_module_level=True)
+
+from pyagar.utils import MessageQueue, BLOCK, DROP_OLDEST, COALESCE
+
+
+class A(int):
+    pass
+
+
+class B(int):
+    pass
+
+
+def run(coro, timeout=0.1):
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(asyncio.wait_for(coro, timeout))
+
+
+def drain(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+        queue.task_done()
+    return items
+
+
+def test_block_waits_for_room():
+    loop = asyncio.get_event_loop()
+    queue = MessageQueue(maxsize=1, overflow=BLOCK)
+    run(queue.push(1))
+    pending = loop.create_task(queue.push(2))
+    loop.run_until_complete(asyncio.sleep(0.01))
+
+    assert not pending.done()
+    assert drain(queue) == [1]
+    run(pending)
+    assert drain(queue) == [2]
+    assert queue.dropped == 0
+    run(queue.join())
+
+
+def test_drop_oldest():
+    queue = MessageQueue(maxsize=2, overflow=DROP_OLDEST)
+    for item in range(4):
+        run(queue.push(item))
+
+    assert drain(queue) == [2, 3]
+    assert queue.dropped == 2
+    run(queue.join())
+
+
+def test_coalesce_supersedes_the_same_type():
+    queue = MessageQueue(maxsize=3, overflow=COALESCE)
+    for item in (A(1), B(2), A(3), A(4)):
+        run(queue.push(item))
+
+    assert drain(queue) == [B(2), A(4)]
+    assert queue.dropped == 2
+    run(queue.join())
+
+
+def test_coalesce_drops_the_oldest_without_the_same_type():
+    queue = MessageQueue(maxsize=2, overflow=COALESCE)
+    for item in (A(1), A(2), B(3)):
+        run(queue.push(item))
+
+    assert drain(queue) == [A(2), B(3)]
+    assert queue.dropped == 1
+    run(queue.join())
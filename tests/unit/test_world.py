@@ -0,0 +1,81 @@
+import struct
+
+from pyagar import messages
+from pyagar.world import World
+
+from test_messages import status_frame
+
+
+def player_cell(_id):
+    return messages.MSG(struct.pack("<BI", 32, _id)).data
+
+
+def test_world_applies_status():
+    world = World()
+    world.apply(messages.MSG(status_frame(
+        cells=[(7, 1, 2, 3, (1, 2, 3), 0, "bob"),
+               (8, 1, 2, 3, (1, 2, 3), 0, "")])).data)
+    world.apply(messages.MSG(status_frame(eats=[(8, 7)])).data)
+
+    assert list(world.cells) == [8]
+    assert world.names == {}
+
+
+def test_world_tracks_owned_cells():
+    world = World()
+    world.apply(player_cell(7))
+    world.apply(player_cell(9))
+    world.apply(messages.MSG(status_frame(
+        cells=[(7, 1, 2, 30, (1, 2, 3), 0, ""),
+               (9, 1, 2, 40, (1, 2, 3), 0, "")])).data)
+
+    assert world.alive
+    assert world.player_id == 9
+
+    world.apply(messages.MSG(status_frame(eats=[(1, 9)])).data)
+    assert world.player_id == 7
+
+    world.apply(messages.MSG(status_frame(dissapears=[7])).data)
+    assert not world.alive
+
+
+def test_world_evicts_stale_cells():
+    world = World(ttl=10)
+    world.apply(messages.MSG(status_frame(
+        cells=[(7, 1, 2, 3, (1, 2, 3), 0, "bob")])).data)
+
+    world.evict(world.seen[7] + 1)
+
+    assert 7 not in world.cells
+    assert 7 not in world.names
+
+
+def test_world_snapshot_rebuilds_state():
+    world = World()
+    world.apply(messages.MSG(struct.pack("<Bdddd", 64, 0, 0, 100, 50)).data)
+    world.apply(player_cell(7))
+    world.apply(messages.MSG(status_frame(
+        cells=[(7, 1, 2, 30, (1, 2, 3), 0, "bob"),
+               (9, 5, 6, 40, (4, 5, 6), 1, "")])).data)
+
+    copy = World()
+    for frame in world.snapshot():
+        copy.apply(messages.MSG(frame).data)
+
+    assert copy.cells == world.cells
+    assert copy.owned == world.owned
+    assert copy.screen == world.screen
+    assert copy.camera == world.camera
+
+
+def test_world_snapshot_keeps_lone_surrogates():
+    world = World()
+    world.apply(messages.MSG(status_frame(
+        cells=[(7, 1, 2, 30, (1, 2, 3), 0, "\ud800bob")])).data)
+
+    copy = World()
+    for frame in world.snapshot():
+        copy.apply(messages.MSG(frame).data)
+
+    assert copy.cells == world.cells
+    assert copy.cells[7].name == "\ud800bob"